@@ -0,0 +1,60 @@
+import functools
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.urls import URLPattern
+from rest_framework.permissions import SAFE_METHODS
+
+# Маршруты, чтение которых в режиме ASGI идёт в пуле потоков.
+ASYNC_READ_ROUTES = {
+    'recipes-list', 'recipes-detail',
+    'ingredients-list', 'ingredients-detail',
+    'tags-list', 'tags-detail',
+}
+
+
+def _run(view, request, *args, **kwargs):
+    """Синхронный view с отрисовкой ответа и закрытием соединений с БД.
+
+    Соединения с базой принадлежат потоку пула, поэтому их срок жизни
+    проверяется здесь, а не сигналами начала и конца запроса.
+    """
+    close_old_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        if callable(getattr(response, 'render', None)):
+            response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def async_read_view(view):
+    """Асинхронный вариант синхронного view для ASGI.
+
+    Под ASGI Django 3.2 выполняет синхронные view в одном общем потоке,
+    и медленный запрос задерживает все остальные. Здесь GET и HEAD
+    целиком, с разбором, запросами к базе и отрисовкой, уходят в пул
+    потоков и выполняются параллельно; остальные методы выполняются
+    как обычно.
+    """
+    read = sync_to_async(_run, thread_sensitive=False)
+    write = sync_to_async(_run)
+
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        run = read if request.method in SAFE_METHODS else write
+        return await run(view, request, *args, **kwargs)
+
+    return wrapper
+
+
+def with_async_reads(patterns, names=ASYNC_READ_ROUTES):
+    """Маршруты, в которых view из names заменены асинхронными."""
+    return [
+        URLPattern(pattern.pattern, async_read_view(pattern.callback),
+                   pattern.default_args, pattern.name)
+        if isinstance(pattern, URLPattern) and pattern.name in names
+        else pattern
+        for pattern in patterns
+    ]
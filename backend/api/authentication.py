@@ -0,0 +1,113 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import cache as django_cache
+from django.db import router
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from api import cache
+from users.models import User
+
+TOKEN_KEY = 'auth:tokens:{}:{}'
+
+
+class LRUCache:
+    """Кэш в памяти процесса с ограниченным размером и временем жизни.
+
+    Запись находится только при совпадении версии, с которой она
+    сохранена.
+    """
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self._lock = Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, value_version, expires = entry
+            if value_version != version or expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, version, value):
+        with self._lock:
+            self._entries[key] = (
+                value, version, time.monotonic() + self.timeout)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = LRUCache(settings.AUTH_TOKEN_CACHE_SIZE,
+                       settings.AUTH_TOKEN_CACHE_TIMEOUT)
+
+
+def user_fields():
+    """Поля пользователя в записи кэша: все, кроме хэша пароля."""
+    return [field.attname for field in User._meta.concrete_fields
+            if field.attname != 'password']
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication с кэшем «токен → пользователь».
+
+    Токен с пользователем ищется в LRU процесса, затем в общем кэше и
+    только затем в базе. Ключи записей содержат версию токена, которую
+    сбрасывают удаление токена и сохранение пользователя, поэтому
+    выход, смена пароля и блокировка действуют сразу во всех процессах,
+    если CACHE_BACKEND общий для них.
+
+    В кэше лежат только дата токена и поля пользователя без пароля.
+    Пароль у пользователя запроса отложен и загружается из базы, если
+    к нему обратиться, например при смене пароля.
+    """
+
+    def authenticate_credentials(self, key):
+        version = cache.token_versions(key)[0]
+        record = token_cache.get(key, version)
+        if record is None:
+            shared_key = TOKEN_KEY.format(key, version)
+            record = django_cache.get(shared_key)
+            if record is None:
+                record = self.load_record(key)
+                django_cache.set(shared_key, record,
+                                 settings.AUTH_TOKEN_CACHE_TIMEOUT)
+            token_cache.set(key, version, record)
+        user, token = self.from_record(key, record)
+        if not user.is_active:
+            raise AuthenticationFailed('Пользователь неактивен или удалён.')
+        return user, token
+
+    def load_record(self, key):
+        model = self.get_model()
+        try:
+            token = model.objects.select_related('user').get(key=key)
+        except model.DoesNotExist:
+            raise AuthenticationFailed('Недопустимый токен.')
+        return token.created, tuple(
+            getattr(token.user, name) for name in user_fields())
+
+    def from_record(self, key, record):
+        """Новые экземпляры токена и пользователя из записи кэша."""
+        created, values = record
+        model = self.get_model()
+        user = User.from_db(router.db_for_read(User), user_fields(), values)
+        token = model.from_db(router.db_for_read(model),
+                              ['key', 'user_id', 'created'],
+                              [key, user.pk, created])
+        token.user = user
+        return user, token
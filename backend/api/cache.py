@@ -0,0 +1,202 @@
+import time
+from datetime import datetime, timezone
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+
+GLOBAL_VERSION_KEY = 'recipes:version'
+LIST_VERSION_KEY = 'recipes:list:version'
+RECIPE_VERSION_KEY = 'recipes:{}:version'
+TABLE_VERSION_KEY = 'tables:{}:version'
+TABLE_CHANGES_KEY = 'tables:{}:changes:{}'
+# Сколько хранится журнал изменений таблицы: процесс, отставший
+# сильнее, перестраивает свои индексы целиком.
+TABLE_CHANGES_TIMEOUT = 60 * 60
+# Версия рецепта создаётся при первом чтении, в том числе рецепта,
+# которого нет, поэтому живёт ограниченное время, чтобы такие ключи не
+# копились в кэше. Потеря версии только даёт промах.
+RECIPE_VERSION_TIMEOUT = 60 * 60 * 24
+USER_VERSION_KEY = 'users:{}:version'
+TOKEN_VERSION_KEY = 'auth:tokens:{}:version'
+HITS_KEY = 'recipes:cache:hits'
+MISSES_KEY = 'recipes:cache:misses'
+
+
+def _new_version():
+    return time.time_ns()
+
+
+def _get_versions(keys, timeouts=None):
+    """Текущие версии ключей, недостающие создаются.
+
+    timeouts — время жизни создаваемых ключей, по умолчанию бессрочно.
+    """
+    timeouts = timeouts or {}
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _new_version(), timeouts.get(key))
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def _request_digest(request):
+    """Хэш адреса запроса с упорядоченными параметрами."""
+    query = sorted(request.query_params.lists())
+    return md5(
+        f'{request.get_host()}{request.path}{query}'.encode()
+    ).hexdigest()
+
+
+def list_versions():
+    """Версии, которые меняет любая правка рецептов."""
+    return _get_versions([GLOBAL_VERSION_KEY, LIST_VERSION_KEY])
+
+
+def list_key(request):
+    global_version, list_version = list_versions()
+    return (f'recipes:list:{global_version}:{list_version}:'
+            f'{_request_digest(request)}')
+
+
+def _recipe_version(pk):
+    """Ключ версии рецепта с временем жизни."""
+    key = RECIPE_VERSION_KEY.format(pk)
+    return key, {key: RECIPE_VERSION_TIMEOUT}
+
+
+def detail_key(request, pk):
+    key, timeouts = _recipe_version(pk)
+    global_version, recipe_version = _get_versions(
+        [GLOBAL_VERSION_KEY, key], timeouts)
+    return (f'recipes:detail:{pk}:{global_version}:{recipe_version}:'
+            f'{_request_digest(request)}')
+
+
+def table_versions(model):
+    """Версия таблицы модели."""
+    return _get_versions([TABLE_VERSION_KEY.format(model._meta.label_lower)])
+
+
+def user_versions(user_id):
+    """Версия отметок пользователя."""
+    return _get_versions([USER_VERSION_KEY.format(user_id)])
+
+
+def token_versions(key):
+    """Версия токена авторизации.
+
+    Живёт не дольше записей кэша токенов, чтобы случайные ключи из
+    запросов не копились в кэше: потеря версии только даёт промах.
+    """
+    version_key = TOKEN_VERSION_KEY.format(key)
+    return _get_versions([version_key],
+                         {version_key: settings.AUTH_TOKEN_CACHE_TIMEOUT})
+
+
+def recipe_versions(request, pk):
+    """Версии рецепта и отметок текущего пользователя."""
+    key, timeouts = _recipe_version(pk)
+    keys = [GLOBAL_VERSION_KEY, key]
+    if request.user.is_authenticated:
+        keys.append(USER_VERSION_KEY.format(request.user.pk))
+    return _get_versions(keys, timeouts)
+
+
+def versions_etag(versions):
+    return '-'.join(str(version) for version in versions)
+
+
+def versions_last_modified(versions):
+    return datetime.fromtimestamp(max(versions) / 10 ** 9, tz=timezone.utc)
+
+
+def _incr(key):
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def get_cached(key):
+    data = cache.get(key)
+    _incr(MISSES_KEY if data is None else HITS_KEY)
+    return data
+
+
+def set_cached(key, data):
+    cache.set(key, data, settings.RECIPE_CACHE_TIMEOUT)
+
+
+def get_stats():
+    stats = cache.get_many([HITS_KEY, MISSES_KEY])
+    return {
+        'hits': stats.get(HITS_KEY, 0),
+        'misses': stats.get(MISSES_KEY, 0),
+    }
+
+
+def invalidate_all():
+    """Сброс всех закэшированных списков и рецептов."""
+    cache.set(GLOBAL_VERSION_KEY, _new_version(), None)
+
+
+def invalidate_table(model, changed=None):
+    """Новая версия таблицы модели.
+
+    changed — id изменённых объектов, например рецептов. Тогда версия
+    растёт на единицу, а id сохраняются в журнал под новой версией,
+    чтобы индексы в памяти процессов обновили только их. Без changed
+    версия меняется скачком, и индексы перестраиваются целиком.
+    """
+    label = model._meta.label_lower
+    key = TABLE_VERSION_KEY.format(label)
+    if changed is not None:
+        try:
+            version = cache.incr(key)
+        except ValueError:
+            pass
+        else:
+            cache.set(TABLE_CHANGES_KEY.format(label, version),
+                      list(changed), TABLE_CHANGES_TIMEOUT)
+            return
+    cache.set(key, _new_version(), None)
+
+
+def table_changes(model, since, version, limit):
+    """id объектов, изменённых между версиями since и version.
+
+    None, если журнал неполон: версия сменилась скачком, записи
+    устарели или их больше limit.
+    """
+    if not since < version <= since + limit:
+        return None
+    label = model._meta.label_lower
+    keys = [TABLE_CHANGES_KEY.format(label, number)
+            for number in range(since + 1, version + 1)]
+    changes = cache.get_many(keys)
+    if len(changes) < len(keys):
+        return None
+    return set().union(*changes.values())
+
+
+def invalidate_user(user_id):
+    """Сброс версии отметок пользователя: избранное, покупки, подписки."""
+    cache.set(USER_VERSION_KEY.format(user_id), _new_version(), None)
+
+
+def invalidate_recipes(recipe_ids):
+    """Сброс рецептов с указанными id и всех списков."""
+    version = _new_version()
+    cache.set_many({RECIPE_VERSION_KEY.format(pk): version
+                    for pk in recipe_ids}, RECIPE_VERSION_TIMEOUT)
+    cache.set(LIST_VERSION_KEY, version, None)
+
+
+def invalidate_tokens(keys):
+    """Сброс закэшированных токенов авторизации."""
+    version = _new_version()
+    cache.set_many({TOKEN_VERSION_KEY.format(key): version for key in keys},
+                   settings.AUTH_TOKEN_CACHE_TIMEOUT)
@@ -0,0 +1,32 @@
+import os
+
+from django.conf import settings
+from django.core import checks
+
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@checks.register(checks.Tags.caches)
+def shared_cache_check(app_configs, **kwargs):
+    """Общий кэш при нескольких воркерах gunicorn.
+
+    Версии в кэше сбрасывают кэш токенов, ответов и отметок, реестр
+    тегов и индексы в памяти. С кэшем в памяти процесса сброс виден
+    только процессу, который его сделал: остальные воркеры, например,
+    принимают токен после выхода до истечения AUTH_TOKEN_CACHE_TIMEOUT.
+    """
+    backend = settings.CACHES['default']['BACKEND']
+    try:
+        workers = int(os.getenv('WEB_CONCURRENCY', 1))
+    except ValueError:
+        workers = 1
+    if backend not in PROCESS_LOCAL_CACHES or workers <= 1:
+        return []
+    return [checks.Error(
+        f'Кэш {backend} не общий для {workers} воркеров (WEB_CONCURRENCY).',
+        hint='Задайте CACHE_BACKEND и CACHE_LOCATION с Redis или '
+             'Memcached либо запускайте один воркер.',
+        id='api.E001')]
@@ -1,21 +1,30 @@
-from django_filters.rest_framework import (AllValuesMultipleFilter,
-                                           BooleanFilter, FilterSet)
-from rest_framework.filters import SearchFilter
+from django_filters.rest_framework import (BooleanFilter, CharFilter,
+                                           FilterSet, MultipleChoiceFilter)
+from rest_framework.filters import OrderingFilter
 
+from api.search import search_recipes
+from api.tags import tag_choices, tag_registry
 from recipes.models import Recipe
 
 
 class RecipesFilter(FilterSet):
     """"Фильтр для сортировки рецептов."""""
-    tags = AllValuesMultipleFilter(field_name='tags__slug',
-                                   label='tags')
+    tags = MultipleChoiceFilter(choices=tag_choices,
+                                method='get_tags', label='tags')
     favorite = BooleanFilter(method='get_favorite')
     shopping_cart = BooleanFilter(method='get_shopping_cart')
+    search = CharFilter(method='get_search')
 
     class Meta:
         model = Recipe
         fields = ('author', 'tags', 'favorite',
-                  'shopping_cart')
+                  'shopping_cart', 'search')
+
+    def get_tags(self, queryset, name, value):
+        """Рецепты с любым из тегов: slug переводятся в id по реестру."""
+        if not value:
+            return queryset
+        return queryset.filter(tags__in=tag_registry.ids(value)).distinct()
 
     def get_favorite(self, queryset, name, value):
         if value:
@@ -24,8 +33,23 @@ class RecipesFilter(FilterSet):
 
     def get_shopping_cart(self, queryset, name, value):
         if value:
-            return Recipe.objects.filter(shopping_cart__user=self.request.user)
+            return queryset.filter(shopping_cart__user=self.request.user)
+        return queryset.exclude(shopping_cart__user=self.request.user)
+
+    def get_search(self, queryset, name, value):
+        """Полнотекстовый поиск по названию и описанию с ранжированием."""
+        return search_recipes(queryset, value)
+
+
+class RecipeOrderingFilter(OrderingFilter):
+    """Сортировка рецептов параметром ordering.
 
+    К выбранному порядку добавляется id, чтобы страницы не
+    перемешивались при равных значениях.
+    """
 
-class IngredientSearchFilter(SearchFilter):
-    search_param = 'name'
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if ordering:
+            return (*ordering, '-id')
+        return ordering
@@ -0,0 +1,70 @@
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache as django_cache
+
+from api import cache
+from recipes.models import Favorite, ShoppingCart
+from users.models import Subscribe
+
+INTERACTIONS_KEY = 'users:{}:interactions:{}:{}'
+
+
+class UserInteractions:
+    """Множества id авторов и рецептов, отмеченных пользователем.
+
+    Каждое множество загружается одним запросом при первом обращении
+    и живёт до конца запроса. При INTERACTIONS_CACHE множества берутся
+    из общего кэша по ключу с версией отметок пользователя, которую
+    сбрасывают записи Subscribe, Favorite и ShoppingCart.
+    """
+    sources = {
+        'subscribed': (Subscribe, 'author_id'),
+        'favorited': (Favorite, 'recipe_id'),
+        'in_shopping_cart': (ShoppingCart, 'recipe_id'),
+    }
+
+    def __init__(self, user):
+        self.user = user
+        self._sets = {}
+
+    @classmethod
+    def for_context(cls, context):
+        """Отметки пользователя запроса из контекста сериализатора."""
+        request = context.get('request')
+        if request is None:
+            return cls(AnonymousUser())
+        interactions = getattr(request, '_interactions', None)
+        if interactions is None:
+            interactions = request._interactions = cls(request.user)
+        return interactions
+
+    def load(self, name):
+        model, field = self.sources[name]
+        return frozenset(model.objects.filter(
+            user=self.user).order_by().values_list(field, flat=True))
+
+    def get(self, name):
+        if name in self._sets:
+            return self._sets[name]
+        if not self.user.is_authenticated:
+            ids = frozenset()
+        elif settings.INTERACTIONS_CACHE:
+            key = INTERACTIONS_KEY.format(
+                self.user.pk, name, cache.user_versions(self.user.pk)[0])
+            ids = django_cache.get(key)
+            if ids is None:
+                ids = self.load(name)
+                django_cache.set(key, ids, settings.RECIPE_CACHE_TIMEOUT)
+        else:
+            ids = self.load(name)
+        self._sets[name] = ids
+        return ids
+
+    def is_subscribed(self, author_id):
+        return author_id in self.get('subscribed')
+
+    def is_favorited(self, recipe_id):
+        return recipe_id in self.get('favorited')
+
+    def is_in_shopping_cart(self, recipe_id):
+        return recipe_id in self.get('in_shopping_cart')
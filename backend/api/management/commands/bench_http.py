@@ -0,0 +1,120 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import Ingredient, Recipe
+from .bench_ingredient_search import percentile
+
+DEFAULT_PATHS = (
+    '/api/recipes/?limit=6',
+    '/api/recipes/?limit=6&page={page}',
+    '/api/recipes/{recipe}/',
+    '/api/ingredients/?name={prefix}',
+    '/api/tags/',
+)
+
+
+class Command(BaseCommand):
+    """Нагрузочный замер чтения API на нескольких серверах"""
+    help = ('Гоняет параллельные GET-запросы к горячим адресам API на '
+            'каждом из серверов, например gunicorn на foodgram.wsgi и '
+            'uvicorn на foodgram.asgi, и сравнивает пропускную '
+            'способность и задержки. Серверы должны смотреть в ту же '
+            'базу, что и команда.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'servers', nargs='+', metavar='NAME=URL',
+            help='Например wsgi=http://127.0.0.1:8000')
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--duration', type=float, default=20,
+                            help='Длительность замера в секундах.')
+        parser.add_argument('--warmup', type=float, default=2)
+        parser.add_argument(
+            '--path', action='append', dest='paths',
+            help='Адрес запроса; {recipe}, {page} и {prefix} заменяются '
+                 'случайными значениями. Можно указать несколько.')
+        parser.add_argument('--token', help='Токен авторизации.')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        servers = []
+        for server in options['servers']:
+            name, _, url = server.partition('=')
+            if not url:
+                raise CommandError(f'Ожидалось NAME=URL: {server}')
+            servers.append((name, url.rstrip('/')))
+        recipes = list(Recipe.objects.values_list('id', flat=True)[:1000])
+        prefixes = list({name[:2].lower() for name in
+                         Ingredient.objects.values_list('name', flat=True)[
+                             :1000]})
+        if not recipes or not prefixes:
+            raise CommandError('Нет рецептов или ингредиентов: '
+                               'выполните load_data и generate_data.')
+        paths = options['paths'] or DEFAULT_PATHS
+        pages = max(1, Recipe.objects.count() // 6)
+        headers = {}
+        if options['token']:
+            headers['Authorization'] = f'Token {options["token"]}'
+        for name, url in servers:
+            rnd = random.Random(options['seed'])
+
+            def next_url():
+                return url + rnd.choice(paths).format(
+                    recipe=rnd.choice(recipes),
+                    page=rnd.randint(1, min(pages, 100)),
+                    prefix=rnd.choice(prefixes))
+
+            self.run(url, next_url, headers, options['concurrency'],
+                     options['warmup'])
+            timings, errors, elapsed = self.run(
+                url, next_url, headers, options['concurrency'],
+                options['duration'])
+            if not timings:
+                self.stdout.write(f'{name}: нет успешных ответов, '
+                                  f'ошибок {errors}')
+                continue
+            self.stdout.write(
+                f'{name}: {len(timings)} запросов, '
+                f'{len(timings) / elapsed:.1f} запросов/с, '
+                f'среднее {sum(timings) / len(timings) * 1000:.1f} мс, '
+                f'p50 {percentile(timings, 0.5):.1f} мс, '
+                f'p99 {percentile(timings, 0.99):.1f} мс, '
+                f'ошибок {errors}')
+
+    @staticmethod
+    def run(url, next_url, headers, concurrency, duration):
+        """Запросы в concurrency потоков в течение duration секунд."""
+        lock = threading.Lock()
+        timings = []
+        errors = 0
+        deadline = time.monotonic() + duration
+
+        def worker():
+            nonlocal errors
+            session = requests.Session()
+            session.headers.update(headers)
+            while time.monotonic() < deadline:
+                with lock:
+                    target = next_url()
+                started = time.perf_counter()
+                try:
+                    ok = session.get(target, timeout=30).status_code < 400
+                except requests.RequestException:
+                    ok = False
+                spent = time.perf_counter() - started
+                with lock:
+                    if ok:
+                        timings.append(spent)
+                    else:
+                        errors += 1
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(concurrency) as executor:
+            for _ in range(concurrency):
+                executor.submit(worker)
+        return timings, errors, time.monotonic() - started
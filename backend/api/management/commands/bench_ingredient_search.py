@@ -0,0 +1,83 @@
+import csv
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.search import IngredientIndex, normalize
+
+
+def percentile(timings, share):
+    return sorted(timings)[int(len(timings) * share) - 1] * 1000
+
+
+class Command(BaseCommand):
+    """Замер скорости и полноты поиска ингредиентов по CSV-файлу"""
+    help = ('Замеряет скорость и полноту поиска ингредиентов в памяти '
+            'на каталоге из CSV.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file', default=f'{settings.BASE_DIR}/data/ingredients.csv',
+            help='CSV-файл каталога: название и единица измерения.')
+        parser.add_argument('--queries', type=int, default=1000,
+                            help='Число запросов каждого вида.')
+        parser.add_argument('--seed', type=int, default=42,
+                            help='Зерно генератора запросов.')
+
+    @staticmethod
+    def typo(word, rnd):
+        """Слово с одной опечаткой: замена, пропуск или лишняя буква."""
+        position = rnd.randrange(len(word))
+        letter = rnd.choice('абвгдеиклмнопрстуя')
+        return rnd.choice((
+            word[:position] + letter + word[position + 1:],
+            word[:position] + word[position + 1:],
+            word[:position] + letter + word[position:],
+        ))
+
+    def measure(self, title, search, queries):
+        timings = []
+        for query in queries:
+            started = time.perf_counter()
+            search(query)
+            timings.append(time.perf_counter() - started)
+        self.stdout.write(
+            f'{title}: {len(queries)} запросов, '
+            f'среднее {sum(timings) / len(timings) * 1000:.3f} мс, '
+            f'p50 {percentile(timings, 0.5):.3f} мс, '
+            f'p99 {percentile(timings, 0.99):.3f} мс')
+
+    def handle(self, *args, **options):
+        with open(options['file'], encoding='utf-8') as file:
+            rows = [(pk, name, unit) for pk, (name, unit)
+                    in enumerate(csv.reader(file), 1)]
+        index = IngredientIndex()
+        started = time.perf_counter()
+        index.load(rows)
+        self.stdout.write(
+            f'Индекс из {len(rows)} ингредиентов построен за '
+            f'{(time.perf_counter() - started) * 1000:.1f} мс')
+
+        rnd = random.Random(options['seed'])
+        names = [normalize(name) for _, name, _ in rows]
+        words = [name.split()[0] for name in names
+                 if len(name.split()[0]) >= 4]
+        prefixes = [name[:rnd.randint(1, 4)]
+                    for name in rnd.choices(names, k=options['queries'])]
+        typos = [(word, self.typo(word, rnd))
+                 for word in rnd.choices(words, k=options['queries'])]
+
+        self.measure('Префикс', index.search, prefixes)
+        self.measure('Префикс, limit=10',
+                     lambda query: index.search(query, 10), prefixes)
+        self.measure('Нечёткий', index.fuzzy_search,
+                     [query for _, query in typos])
+        found = sum(
+            any(normalize(item['name']).split()[0] == word
+                for item in index.fuzzy_search(query, 10))
+            for word, query in typos)
+        self.stdout.write(
+            f'Полнота нечёткого поиска (слово в первых 10): '
+            f'{found / len(typos):.1%}')
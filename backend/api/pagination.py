@@ -0,0 +1,177 @@
+from base64 import b64decode, b64encode
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class RecipeCursorPagination(BasePagination):
+    """Курсорная (keyset) пагинация рецептов по паре (pub_date, id).
+
+    Страница выбирается условием по ключу последней записи, поэтому
+    не требует COUNT(*) и OFFSET: глубокие страницы стоят столько же,
+    сколько первая.
+    """
+    cursor_query_param = 'cursor'
+    page_size = settings.DEFAULT_ITEM_PER_PAGE
+    page_size_query_param = 'limit'
+    max_page_size = settings.MAX_ITEM_PER_PAGE
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        position, reverse = self.prepare(request)
+        return self.finish(
+            list(self.seek(queryset, position, reverse)[:self.page_size + 1]),
+            position, reverse)
+
+    def prepare(self, request):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        return self.decode_cursor(request)
+
+    def seek(self, queryset, position, reverse, id_field='id'):
+        """Записи после позиции курсора в порядке обхода."""
+        if position is None:
+            return queryset.order_by('-pub_date', f'-{id_field}')
+        pub_date, pk = position
+        if reverse:
+            return queryset.filter(
+                Q(pub_date__gt=pub_date)
+                | Q(pub_date=pub_date, **{f'{id_field}__gt': pk})
+            ).order_by('pub_date', id_field)
+        return queryset.filter(
+            Q(pub_date__lt=pub_date)
+            | Q(pub_date=pub_date, **{f'{id_field}__lt': pk})
+        ).order_by('-pub_date', f'-{id_field}')
+
+    def finish(self, results, position, reverse):
+        """Страница из page_size + 1 записей в порядке обхода."""
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+        self.page = results
+        return results
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            pub_date, pk, reverse = b64decode(
+                encoded.encode('ascii')).decode('ascii').split('|')
+            pub_date = parse_datetime(pub_date)
+            pk = int(pk)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if pub_date is None:
+            raise NotFound(self.invalid_cursor_message)
+        return (pub_date, pk), reverse == '1'
+
+    def encode_cursor(self, recipe, reverse):
+        cursor = f'{recipe.pub_date.isoformat()}|{recipe.id}|{int(reverse)}'
+        return replace_query_param(
+            self.base_url, self.cursor_query_param,
+            b64encode(cursor.encode('ascii')).decode('ascii'))
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+
+FeedRow = namedtuple('FeedRow', ('pub_date', 'id'))
+
+
+class FeedPagination(RecipeCursorPagination):
+    """Курсорная пагинация ленты подписок из нескольких источников.
+
+    Каждый источник читается с одной и той же позиции курсора не
+    больше чем на страницу вперёд, результаты сливаются по (pub_date,
+    id). Возвращает строки FeedRow, рецепты по ним загружает вызывающий.
+    """
+
+    def paginate_sources(self, sources, request):
+        position, reverse = self.prepare(request)
+        rows = set()
+        for queryset, id_field in sources:
+            rows.update(self.seek(queryset, position, reverse, id_field)[
+                :self.page_size + 1])
+        rows = sorted(rows, reverse=not reverse)[:self.page_size + 1]
+        return self.finish(
+            [FeedRow(pub_date, pk) for pub_date, pk in rows],
+            position, reverse)
+
+
+class LimitPagination(PageNumberPagination):
+    """Пагинация по номеру страницы с размером в параметре limit."""
+    page_size_query_param = 'limit'
+    max_page_size = settings.MAX_ITEM_PER_PAGE
+
+
+class RecipePagination(LimitPagination):
+    """Постраничная пагинация рецептов.
+
+    По умолчанию работает по номеру страницы. При наличии в запросе
+    параметра ``cursor`` (для первой страницы — пустого) переключается
+    на курсорную пагинацию. Курсор задаёт порядок по дате публикации,
+    поэтому вместе с поиском или сортировкой он отклоняется.
+    """
+    cursor_pagination_class = RecipeCursorPagination
+    cursor_conflicts = ('search', 'ordering')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if self.cursor_pagination_class.cursor_query_param in (
+                request.query_params):
+            conflicts = [name for name in self.cursor_conflicts
+                         if request.query_params.get(name)]
+            if conflicts:
+                raise ValidationError({
+                    name: 'Не сочетается с параметром cursor.'
+                    for name in conflicts})
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
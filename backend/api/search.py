@@ -0,0 +1,444 @@
+import re
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from threading import Lock
+
+from django.conf import settings
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            TrigramSimilarity)
+from django.db import connection
+from django.db.models import (Case, ExpressionWrapper, F, FloatField,
+                              IntegerField, Q, Value, When)
+from django.db.models.functions import Upper
+
+from api import cache
+from recipes.models import (SEARCH_CONFIG, Ingredient, IngredientInRecipe,
+                            Recipe)
+
+WORD_RE = re.compile(r'\w+')
+PREFIX_RANK = 2
+SUBSTRING_RANK = 1
+NAME_WEIGHT = 2
+TEXT_WEIGHT = 1
+# Окончания русских существительных, прилагательных и глаголов и
+# минимальная длина основы: грубая замена стеммингу в индексе рецептов.
+RUSSIAN_ENDINGS = sorted({
+    'а', 'я', 'о', 'е', 'ё', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+    'ам', 'ям', 'ом', 'ем', 'им', 'ым', 'ах', 'ях', 'ов', 'ев',
+    'ей', 'ой', 'ий', 'ый', 'ая', 'яя', 'ое', 'ее', 'ие', 'ые', 'ую',
+    'юю', 'ою', 'ею', 'их', 'ых', 'ия', 'ья', 'ию', 'ью', 'ье',
+    'ии', 'ть', 'ет', 'ит', 'ут', 'ют', 'ат', 'ят', 'ла', 'ло', 'ли',
+    'ами', 'ями', 'ого', 'его', 'ому', 'ему', 'ими', 'ыми', 'ией', 'иям',
+    'иях', 'ием', 'ать', 'ять', 'еть', 'ить', 'ыть', 'ешь', 'ишь',
+    'ете', 'ите', 'иями',
+}, key=len, reverse=True)
+REFLEXIVE_ENDINGS = ('ся', 'сь')
+MIN_STEM_LENGTH = 3
+
+
+def normalize(text):
+    """Приведение строки к виду для поиска без учёта регистра и «ё»."""
+    return text.strip().casefold().replace('ё', 'е')
+
+
+def stem(word):
+    """Слово без возвратной частицы и самого длинного окончания."""
+    for ending in REFLEXIVE_ENDINGS:
+        if word.endswith(ending) and len(word) - 2 >= MIN_STEM_LENGTH:
+            word = word[:-2]
+            break
+    for ending in RUSSIAN_ENDINGS:
+        if (word.endswith(ending)
+                and len(word) - len(ending) >= MIN_STEM_LENGTH):
+            return word[:-len(ending)]
+    return word
+
+
+def trigrams(word):
+    """Триграммы слова с дополнением пробелами, как в pg_trgm."""
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(first, second, limit):
+    """Расстояние Левенштейна или limit + 1, если оно больше limit."""
+    if len(first) < len(second):
+        first, second = second, first
+    previous = list(range(len(second) + 1))
+    for i, first_char in enumerate(first, 1):
+        current = [i]
+        for j, second_char in enumerate(second, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (first_char != second_char),
+            ))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class IngredientIndex:
+    """Поисковый индекс ингредиентов в памяти процесса.
+
+    Хранит отсортированный список нормализованных названий и ищет
+    границы префикса бинарным поиском, а для нечёткого поиска держит
+    обратный индекс триграмм слов. Индекс строится при первом
+    обращении и перестраивается, когда меняется версия таблицы
+    ингредиентов в общем кэше, так что все процессы видят правку.
+    """
+    similarity_threshold = 0.6
+
+    def __init__(self):
+        self._lock = Lock()
+        self._version = None
+        self._entries = ([], [], {}, {})
+
+    def load(self, rows, version=None):
+        """Построение индекса из строк (id, name, measurement_unit)."""
+        entries = sorted(
+            (normalize(name), name, pk, measurement_unit)
+            for pk, name, measurement_unit in rows
+        )
+        keys = [key for key, *_ in entries]
+        words = defaultdict(set)
+        for position, key in enumerate(keys):
+            for word in WORD_RE.findall(key):
+                words[word].add(position)
+        postings = defaultdict(list)
+        for word in words:
+            for trigram in trigrams(word):
+                postings[trigram].append(word)
+        self._entries = (
+            keys,
+            [{'id': pk, 'name': name, 'measurement_unit': measurement_unit}
+             for _, name, pk, measurement_unit in entries],
+            dict(words),
+            dict(postings),
+        )
+        self._version = version
+
+    def refresh(self):
+        version = cache.table_versions(Ingredient)[0]
+        if version == self._version:
+            return
+        with self._lock:
+            if version != self._version:
+                self.load(
+                    Ingredient.objects.values_list(
+                        'id', 'name', 'measurement_unit').iterator(),
+                    version,
+                )
+
+    def search(self, prefix='', limit=None):
+        """Ингредиенты, название которых начинается с prefix."""
+        keys, items, *_ = self._entries
+        prefix = normalize(prefix)
+        start = bisect_left(keys, prefix)
+        stop = bisect_left(keys, prefix + '\uffff', lo=start)
+        if limit is not None and limit > 0:
+            stop = min(stop, start + limit)
+        return items[start:stop]
+
+    def _similar(self, query_words, words, postings):
+        """Позиции названий, похожих на все слова запроса, и их сходство."""
+        scores = None
+        threshold = self.similarity_threshold
+        for query_word in query_words:
+            query_trigrams = trigrams(query_word)
+            shared = Counter()
+            for trigram in query_trigrams:
+                shared.update(postings.get(trigram, ()))
+            best = {}
+            for word, count in shared.items():
+                # Каждая правка портит не больше трёх триграмм запроса,
+                # а разница длин не больше числа правок.
+                max_edits = int((1 - threshold)
+                                * max(len(word), len(query_word)))
+                if (abs(len(word) - len(query_word)) > max_edits
+                        or count < len(query_trigrams) - 3 * max_edits):
+                    continue
+                distance = edit_distance(query_word, word, max_edits)
+                if distance > max_edits:
+                    continue
+                similarity = 1 - distance / max(len(word), len(query_word))
+                for position in words[word]:
+                    if similarity > best.get(position, 0):
+                        best[position] = similarity
+            if scores is None:
+                scores = best
+            else:
+                scores = {position: scores[position] + similarity
+                          for position, similarity in best.items()
+                          if position in scores}
+        return {position: score / len(query_words)
+                for position, score in (scores or {}).items()}
+
+    def fuzzy_search(self, query, limit=None):
+        """Ранжированный поиск с опечатками.
+
+        Сначала идут совпадения по началу названия, затем по вхождению
+        подстроки, затем похожие по триграммам слова. Оценка score равна
+        рангу группы (2, 1 или 0) плюс сходство запроса и названия.
+        """
+        keys, items, words, postings = self._entries
+        query = normalize(query)
+        if not query:
+            return []
+        ranked = {}
+        for position, key in enumerate(keys):
+            if key.startswith(query):
+                ranked[position] = PREFIX_RANK + len(query) / len(key)
+            elif query in key:
+                ranked[position] = SUBSTRING_RANK + len(query) / len(key)
+        query_words = WORD_RE.findall(query)
+        if query_words:
+            for position, similarity in self._similar(
+                    query_words, words, postings).items():
+                ranked.setdefault(position, similarity)
+        order = sorted(ranked, key=lambda position: (
+            -ranked[position], keys[position]))
+        if limit is not None and limit > 0:
+            order = order[:limit]
+        return [dict(items[position], score=round(ranked[position], 3))
+                for position in order]
+
+
+def postgres_fuzzy_search(query, limit=None):
+    """Ранжированный поиск с опечатками на стороне PostgreSQL.
+
+    Использует GIN-индекс pg_trgm по UPPER(name), который создаёт
+    миграция, если расширение доступно.
+    """
+    query = query.strip().upper()
+    if not query:
+        return []
+    queryset = Ingredient.objects.annotate(
+        search_name=Upper('name'),
+    ).filter(
+        Q(search_name__contains=query)
+        | Q(search_name__trigram_similar=query)
+    ).annotate(
+        rank=Case(
+            When(search_name__startswith=query, then=Value(PREFIX_RANK)),
+            When(search_name__contains=query, then=Value(SUBSTRING_RANK)),
+            default=Value(0),
+            output_field=IntegerField(),
+        ),
+        similarity=TrigramSimilarity('search_name', query),
+    ).annotate(
+        score=ExpressionWrapper(F('rank') + F('similarity'),
+                                output_field=FloatField()),
+    ).order_by('-score', 'name').values(
+        'id', 'name', 'measurement_unit', 'score')
+    if limit is not None and limit > 0:
+        queryset = queryset[:limit]
+    return [dict(item, score=round(item['score'], 3)) for item in queryset]
+
+
+ingredient_index = IngredientIndex()
+
+
+def search_ingredients(query='', limit=None, fuzzy=False):
+    """Поиск ингредиентов по началу названия или с опечатками."""
+    if fuzzy and settings.INGREDIENT_SEARCH_BACKEND == 'postgres':
+        return postgres_fuzzy_search(query, limit)
+    ingredient_index.refresh()
+    if fuzzy:
+        return ingredient_index.fuzzy_search(query, limit)
+    return ingredient_index.search(query, limit)
+
+
+class RecipeIndex:
+    """Обратный индекс рецептов в памяти для полнотекстового поиска.
+
+    Запасной вариант для баз без tsvector, например SQLite в тестах.
+    Вместо стемминга основа слова запроса (stem) ищется как префикс
+    слов словаря, поэтому результаты лишь приблизительно совпадают
+    с поиском в PostgreSQL. Индекс перестраивается при смене версии списков
+    рецептов в общем кэше.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._version = None
+        self._entries = ([], {})
+
+    def load(self, rows, version=None):
+        """Построение индекса из строк (id, name, text)."""
+        postings = defaultdict(Counter)
+        for pk, name, text in rows:
+            for word in WORD_RE.findall(normalize(name)):
+                postings[word][pk] += NAME_WEIGHT
+            for word in WORD_RE.findall(normalize(text)):
+                postings[word][pk] += TEXT_WEIGHT
+        self._entries = (sorted(postings), dict(postings))
+        self._version = version
+
+    def refresh(self):
+        version = cache.list_versions()
+        if version == self._version:
+            return
+        with self._lock:
+            if version != self._version:
+                self.load(Recipe.objects.values_list(
+                    'id', 'name', 'text').iterator(), version)
+
+    def search(self, query):
+        """id рецептов со всеми словами запроса по убыванию веса."""
+        words, postings = self._entries
+        scores = None
+        for term in WORD_RE.findall(normalize(query)):
+            prefix = stem(term)
+            found = Counter()
+            position = bisect_left(words, prefix)
+            while position < len(words) and words[position].startswith(
+                    prefix):
+                found.update(postings[words[position]])
+                position += 1
+            scores = found if scores is None else Counter({
+                pk: scores[pk] + weight for pk, weight in found.items()
+                if pk in scores})
+        return [pk for pk, _ in sorted(
+            (scores or {}).items(), key=lambda item: (-item[1], -item[0]))]
+
+
+recipe_index = RecipeIndex()
+
+
+def search_recipes(queryset, query):
+    """Рецепты queryset, подходящие под запрос, по убыванию ранга.
+
+    В PostgreSQL ищет по полю search_vector с русским стеммингом,
+    в остальных базах — по индексу в памяти.
+    """
+    if connection.vendor == 'postgresql':
+        search_query = SearchQuery(query, config=SEARCH_CONFIG)
+        return queryset.filter(search_vector=search_query).annotate(
+            rank=SearchRank(F('search_vector'), search_query),
+        ).order_by('-rank', '-pub_date', '-id')
+    recipe_index.refresh()
+    ids = recipe_index.search(query)
+    return queryset.filter(pk__in=ids).order_by(Case(
+        *(When(pk=pk, then=Value(position))
+          for position, pk in enumerate(ids)),
+        output_field=IntegerField(),
+    ))
+
+
+class IngredientRecipeIndex:
+    """Обратный индекс «ингредиент → рецепты» в памяти процесса.
+
+    Для каждого ингредиента хранит массив id рецептов, для каждого
+    рецепта — массив id его ингредиентов. При смене версии таблицы
+    ингредиентов в рецептах в общем кэше перечитываются только рецепты
+    из журнала изменений; если журнал неполон, индекс строится заново.
+    """
+    max_changes = 100
+
+    def __init__(self):
+        self._lock = Lock()
+        self._version = None
+        self._entries = ({}, {})
+
+    @staticmethod
+    def rows(recipe_ids=None):
+        rows = IngredientInRecipe.objects.filter(ingredients__isnull=False)
+        if recipe_ids is not None:
+            rows = rows.filter(recipe_id__in=recipe_ids)
+        return rows.order_by('ingredients_id', 'recipe_id').values_list(
+            'ingredients_id', 'recipe_id').iterator()
+
+    def load(self, rows, version=None):
+        """Построение индекса из строк (ingredient_id, recipe_id)."""
+        postings = defaultdict(lambda: array('q'))
+        recipes = defaultdict(lambda: array('q'))
+        for ingredient_id, recipe_id in rows:
+            postings[ingredient_id].append(recipe_id)
+            recipes[recipe_id].append(ingredient_id)
+        self._entries = (dict(postings), dict(recipes))
+        self._version = version
+
+    def apply(self, recipe_ids, rows, version=None):
+        """Замена ингредиентов рецептов recipe_ids строками rows.
+
+        Изменённые массивы собираются заново и подменяются целиком,
+        поэтому параллельный match() их не видит наполовину.
+        """
+        postings, recipes = self._entries
+        current = defaultdict(lambda: array('q'))
+        for ingredient_id, recipe_id in rows:
+            current[recipe_id].append(ingredient_id)
+        removed = defaultdict(set)
+        added = defaultdict(list)
+        for recipe_id in recipe_ids:
+            old = set(recipes.get(recipe_id, ()))
+            new = set(current.get(recipe_id, ()))
+            for ingredient_id in old - new:
+                removed[ingredient_id].add(recipe_id)
+            for ingredient_id in new - old:
+                added[ingredient_id].append(recipe_id)
+        for ingredient_id in removed.keys() | added.keys():
+            posting = array('q', (
+                pk for pk in postings.get(ingredient_id, ())
+                if pk not in removed[ingredient_id]))
+            posting.extend(added[ingredient_id])
+            if posting:
+                postings[ingredient_id] = posting
+            else:
+                postings.pop(ingredient_id, None)
+        for recipe_id in recipe_ids:
+            if recipe_id in current:
+                recipes[recipe_id] = current[recipe_id]
+            else:
+                recipes.pop(recipe_id, None)
+        self._version = version
+
+    def refresh(self):
+        version = cache.table_versions(IngredientInRecipe)[0]
+        if version == self._version:
+            return
+        with self._lock:
+            if version == self._version:
+                return
+            changed = None
+            if self._version is not None:
+                changed = cache.table_changes(
+                    IngredientInRecipe, self._version, version,
+                    self.max_changes)
+            if changed is None:
+                self.load(self.rows(), version)
+            else:
+                self.apply(changed, self.rows(changed), version)
+
+    def match(self, ingredient_ids):
+        """Рецепты, в которых есть хотя бы один из ингредиентов.
+
+        Возвращает список (recipe_id, matched, missing): сначала
+        рецепты, для которых меньше всего не хватает, затем с большей
+        долей и большим числом имеющихся ингредиентов, затем более
+        новые.
+        """
+        postings, recipes = self._entries
+        matched = Counter()
+        for ingredient_id in set(ingredient_ids):
+            matched.update(postings.get(ingredient_id, ()))
+        found = []
+        for recipe_id, count in matched.items():
+            # Рецепт мог быть удалён из индекса, пока шёл подсчёт.
+            total = len(recipes.get(recipe_id, ()))
+            if total >= count:
+                found.append((recipe_id, count, total - count))
+        return sorted(found, key=lambda item: (
+            item[2], -item[1] / (item[1] + item[2]), -item[1], -item[0]))
+
+
+ingredient_recipe_index = IngredientRecipeIndex()
+
+
+def recipes_by_ingredients(ingredient_ids):
+    """Ранжированные совпадения рецептов с имеющимися ингредиентами."""
+    ingredient_recipe_index.refresh()
+    return ingredient_recipe_index.match(ingredient_ids)
@@ -1,20 +1,26 @@
+from collections import defaultdict
+
+from django.conf import settings
 from django.contrib.auth import authenticate
 from django.contrib.auth.hashers import make_password
 from django.db import transaction
-from django.db.models import F
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import validators
 from rest_framework.serializers import (CharField, EmailField, Field,
-                                        IntegerField, ModelSerializer,
+                                        IntegerField, ListField,
+                                        ModelSerializer,
                                         PrimaryKeyRelatedField, ReadOnlyField,
                                         Serializer, SerializerMethodField,
                                         ValidationError)
 from rest_framework.validators import UniqueValidator
 
-from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
-                            ShoppingCart, Tag)
-from users.models import Subscribe, User
+from api import cache
+from api.interactions import UserInteractions
+from api.tags import tag_registry
+from recipes.models import (Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingCartIngredient, Tag)
+from users.models import User
 
 
 class CreateUserSerializer(UserCreateSerializer):
@@ -43,10 +49,8 @@ class UsersSerializer(UserSerializer):
                   'is_subscribed')
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        if user.is_authenticated:
-            return Subscribe.objects.filter(user=user, author=obj).exists()
-        return False
+        return UserInteractions.for_context(self.context).is_subscribed(
+            obj.pk)
 
 
 class TagSerializer(ModelSerializer):
@@ -56,6 +60,21 @@ class TagSerializer(ModelSerializer):
         fields = '__all__'
 
 
+class TagField(PrimaryKeyRelatedField):
+    """id тега, который ищется в реестре тегов, а не в базе."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            tag = tag_registry.get(int(data))
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if tag is None:
+            self.fail('does_not_exist', pk_value=data)
+        return tag
+
+
 class IngredientSerializer(ModelSerializer):
     """Сериализатор для ингредиентов"""
     class Meta:
@@ -102,23 +121,17 @@ class RecipeSerializer(ModelSerializer):
 
     def get_is_in_shopping_cart(self, obj):
         """Проверка рецепта в корзине покупок"""
-        user = self.context.get('request').user
-        if user.is_authenticated:
-            return ShoppingCart.objects.filter(
-                user=user, recipe=obj).exists()
-        return False
+        return UserInteractions.for_context(
+            self.context).is_in_shopping_cart(obj.pk)
 
     def get_is_favorited(self, obj):
         """Проверка рецепта в списке избранного"""
-        user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return Favorite.objects.filter(recipe=obj,
-                                       user=user).exists()
+        return UserInteractions.for_context(self.context).is_favorited(
+            obj.pk)
 
     @staticmethod
     def get_ingredients(obj):
-        ingredients = IngredientInRecipe.objects.filter(recipe=obj)
+        ingredients = obj.recipe_ingredients.all()
         return ReadIngredientsInRecipeSerializer(ingredients,
                                                  many=True).data
 
@@ -126,8 +139,7 @@ class RecipeSerializer(ModelSerializer):
 class RecipeCreateSerializer(ModelSerializer):
     """Сериализатор для создания рецептов."""
     ingredients = IngredientCreateSerializer(many=True)
-    tags = PrimaryKeyRelatedField(queryset=Tag.objects.all(),
-                                  many=True)
+    tags = TagField(queryset=Tag.objects.all(), many=True)
     image = Base64ImageField()
     name = CharField(max_length=200)
     author = UserSerializer(read_only=True)
@@ -139,19 +151,50 @@ class RecipeCreateSerializer(ModelSerializer):
                   'cooking_time', 'author')
 
     @staticmethod
-    def create_ingredients(ingredients, recipe):
-        for ingredient in ingredients:
-            amount = ingredient['amount']
-            if IngredientInRecipe.objects.filter(
-                    recipe=recipe,
-                    ingredients=Ingredient.objects.get(
-                    ingredients__id=ingredient['id'])):
-                amount += F('amount')
-            IngredientInRecipe.objects.update_or_create(
-                recipe=recipe,
-                ingredients=Ingredient.objects.get(
-                    ingredients__id=ingredient['id']),
-                defaults={'amount': amount})
+    def create_ingredients(amounts, recipe):
+        """Ингредиенты нового рецепта одним bulk_create."""
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(recipe=recipe, ingredients_id=pk,
+                               amount=amount)
+            for pk, amount in amounts.items())
+
+    @staticmethod
+    def update_ingredients(amounts, recipe):
+        """Применение разницы старых и новых ингредиентов рецепта.
+
+        Возвращает id ингредиентов, которые добавлены, удалены или
+        изменили количество.
+        """
+        rows = {row.ingredients_id: row
+                for row in recipe.recipe_ingredients.all()}
+        created = [
+            IngredientInRecipe(recipe=recipe, ingredients_id=pk,
+                               amount=amount)
+            for pk, amount in amounts.items() if pk not in rows]
+        updated = []
+        for pk, row in rows.items():
+            if pk in amounts and row.amount != amounts[pk]:
+                row.amount = amounts[pk]
+                updated.append(row)
+        deleted = [pk for pk in rows if pk not in amounts]
+        IngredientInRecipe.objects.bulk_create(created)
+        IngredientInRecipe.objects.bulk_update(updated, ['amount'])
+        if deleted:
+            IngredientInRecipe.objects.filter(
+                recipe=recipe, ingredients_id__in=deleted).delete()
+        return ({row.ingredients_id for row in created}
+                | {row.ingredients_id for row in updated} | set(deleted))
+
+    @staticmethod
+    def ingredients_changed(recipe):
+        """Сброс версии ингредиентов рецептов после фиксации транзакции.
+
+        По этой версии и журналу изменённых рецептов обновляется индекс
+        поиска по ингредиентам.
+        """
+        pk = recipe.pk
+        transaction.on_commit(
+            lambda: cache.invalidate_table(IngredientInRecipe, [pk]))
 
     @transaction.atomic
     def create(self, validated_data):
@@ -161,6 +204,7 @@ class RecipeCreateSerializer(ModelSerializer):
         recipe = Recipe.objects.create(image=image,
                                        **validated_data)
         self.create_ingredients(ingredients_data, recipe)
+        self.ingredients_changed(recipe)
         recipe.tags.set(tags_data)
         return recipe
 
@@ -168,23 +212,41 @@ class RecipeCreateSerializer(ModelSerializer):
     def update(self, recipe, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
-        IngredientInRecipe.objects.filter(recipe=recipe).delete()
-        self.create_ingredients(ingredients, recipe)
+        changed = self.update_ingredients(ingredients, recipe)
+        if changed:
+            ShoppingCartIngredient.objects.rebuild(
+                User.objects.filter(shopping_cart__recipe=recipe), changed)
+            self.ingredients_changed(recipe)
         recipe.tags.set(tags)
         return super().update(recipe, validated_data)
 
     def to_representation(self, recipe):
+        request = self.context.get('request')
+        recipe = Recipe.objects.with_related().get(pk=recipe.pk)
         data = RecipeSerializer(
             recipe,
-            context={'request': self.context.get('request')}).data
+            context={'request': request}).data
         return data
 
     def validate_ingredients(self, ingredients):
+        """Количества по id ингредиента, повторы суммируются."""
+        amounts = defaultdict(int)
         for ingredient in ingredients:
             if int(ingredient['amount']) <= 0:
                 raise ValidationError(
                     'Количество ингредиентов должно быть больше 0')
-        return ingredients
+            amounts[ingredient['id']] += ingredient['amount']
+        missing = set(amounts) - set(Ingredient.objects.in_bulk(
+            list(amounts)))
+        if missing:
+            raise ValidationError(
+                'Нет ингредиентов с id: '
+                f'{", ".join(str(pk) for pk in sorted(missing))}')
+        if max(amounts.values(), default=0) > settings.MAX_INGREDIENT_AMOUNT:
+            raise ValidationError(
+                f'Максимальное количество ингредиента '
+                f'{settings.MAX_INGREDIENT_AMOUNT}')
+        return dict(amounts)
 
 
 class RecipeForFollowersSerializer(ModelSerializer):
@@ -195,11 +257,17 @@ class RecipeForFollowersSerializer(ModelSerializer):
                   'image', 'cooking_time')
 
 
+class RecipeIdsSerializer(Serializer):
+    """Сериализатор списка id рецептов для пакетных операций."""
+    ids = ListField(child=IntegerField(min_value=1), allow_empty=False,
+                    max_length=settings.MAX_RECIPES_IN_BATCH)
+
+
 class RecipeFollowUserField(Field):
     """Сериализатор для вывода рецептов в подписках."""
 
     def get_attribute(self, instance):
-        return Recipe.objects.filter(author=instance.author)
+        return instance.author.latest_recipes
 
     def to_representation(self, recipes_list):
         recipes_data = []
@@ -234,11 +302,11 @@ class FollowSerializer(ModelSerializer):
                   'recipes', 'recipes_count')
 
     def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj.author).count()
+        return obj.recipes_count
 
     def get_is_subscribed(self, obj):
-        return Subscribe.objects.filter(user=obj.user,
-                                        author=obj.author).exists()
+        # Сериализуется сама подписка, значит пользователь подписан.
+        return True
 
 
 class UserPasswordSerializer(Serializer):
@@ -1,33 +1,92 @@
-from django.http import HttpResponse
-
-from recipes.models import ShoppingCart
-
-
-def collect_shopping_cart(request):
-    """Создание списка покупок"""
-    shopping_cart = ShoppingCart.objects.filter(user=request.user).all()
-    shopping_list = {}
-    for item in shopping_cart:
-        for recipe_ingredient in item.recipe.recipe_ingredients.all():
-            name = recipe_ingredient.ingredients.name
-            measuring_unit = recipe_ingredient.ingredients.measurement_unit
-            amount = recipe_ingredient.amount
-            if name not in shopping_list:
-                shopping_list[name] = {
-                    'name': name,
-                    'measurement_unit': measuring_unit,
-                    'amount': amount
-                }
-            else:
-                shopping_list[name]['amount'] += amount
-    content = (
-        [f'{item["name"]} ({item["measurement_unit"]}) '
-         f'- {item["amount"]}\n'
-         for item in shopping_list.values()]
-    )
-    filename = 'shopping_list.txt'
-    response = HttpResponse(content, content_type='text/plain')
-    response['Content-Disposition'] = (
-        f'attachment; filename={0}'.format(filename)
-    )
+import csv
+import json
+
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+
+from recipes.models import ShoppingCartIngredient
+from recipes.transfer import NDJSON_CONTENT_TYPE, export_recipes
+
+SHOPPING_LIST_FILENAME = 'shopping_list'
+RECIPES_EXPORT_FILENAME = 'recipes.ndjson'
+
+
+class Echo:
+    """Псевдо-файл для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def shopping_cart_ingredients(user):
+    """Суммы ингредиентов из списка покупок пользователя."""
+    return ShoppingCartIngredient.objects.filter(
+        user=user,
+    ).order_by('ingredient__name').values_list(
+        'ingredient__name', 'ingredient__measurement_unit', 'amount',
+    ).iterator()
+
+
+def render_txt(rows):
+    yield 'Список покупок:\n'
+    for name, measurement_unit, amount in rows:
+        yield f'{name.capitalize()} {amount} {measurement_unit},\n'
+
+
+def render_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def render_json(rows):
+    separator = '['
+    for name, measurement_unit, amount in rows:
+        yield separator + json.dumps(
+            {'name': name, 'measurement_unit': measurement_unit,
+             'amount': amount},
+            ensure_ascii=False)
+        separator = ','
+    yield ']' if separator == ',' else '[]'
+
+
+SHOPPING_LIST_FORMATS = {
+    'txt': (render_txt, 'text/plain; charset=utf-8'),
+    'csv': (render_csv, 'text/csv; charset=utf-8'),
+    'json': (render_json, 'application/json'),
+}
+
+
+def is_asgi(request):
+    """Запрос пришёл через ASGI-обработчик Django."""
+    return isinstance(getattr(request, '_request', request), ASGIRequest)
+
+
+def attachment_response(request, content, content_type, filename):
+    """Потоковая выгрузка файла во вложении.
+
+    Под ASGI Django 3.2 перебирает StreamingHttpResponse в цикле
+    событий, где запросы к базе запрещены. Поэтому там содержимое
+    вычисляется сразу, в потоке view, и отдаётся уже готовыми частями.
+    """
+    if is_asgi(request):
+        content = list(content)
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
     return response
+
+
+def shopping_list_response(request, rows, file_format):
+    """Выгрузка списка покупок в файл нужного формата."""
+    render, content_type = SHOPPING_LIST_FORMATS[file_format]
+    return attachment_response(
+        request, render(rows), content_type,
+        f'{SHOPPING_LIST_FILENAME}.{file_format}')
+
+
+def recipes_export_response(request, with_hashes=False):
+    """Выгрузка всех рецептов в NDJSON."""
+    return attachment_response(
+        request, export_recipes(with_hashes=with_hashes),
+        NDJSON_CONTENT_TYPE, RECIPES_EXPORT_FILENAME)
@@ -0,0 +1,122 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api import cache
+from recipes.models import (Favorite, FeedEntry, Ingredient,
+                            IngredientInRecipe, Recipe, ShoppingCart, Tag)
+from recipes.signals import bulk_changed
+from users.models import Subscribe, User
+
+USER_PUBLIC_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    # Как и для каталога, версии меняем после фиксации: иначе анонимный
+    # запрос успеет закэшировать старую строку уже под новой версией.
+    pk = instance.pk
+    transaction.on_commit(lambda: cache.invalidate_recipes([pk]))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        FeedEntry.objects.fan_out(instance)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        Recipe.objects.filter(pk=instance.pk).update_search_vector()
+
+
+@receiver((post_save, post_delete), sender=IngredientInRecipe)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    recipe_id = instance.recipe_id
+    transaction.on_commit(lambda: cache.invalidate_recipes([recipe_id]))
+    transaction.on_commit(
+        lambda: cache.invalidate_table(IngredientInRecipe, [recipe_id]))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        pks = [instance.pk]
+    elif pk_set:
+        pks = list(pk_set)
+    else:
+        transaction.on_commit(cache.invalidate_all)
+        return
+    transaction.on_commit(lambda: cache.invalidate_recipes(pks))
+
+
+@receiver(bulk_changed)
+@receiver((post_save, post_delete), sender=Tag)
+@receiver((post_save, post_delete), sender=Ingredient)
+def catalog_changed(sender, **kwargs):
+    # Версию таблицы меняем после фиксации: иначе другой процесс успеет
+    # перечитать в реестр или индекс старые строки уже с новой версией.
+    transaction.on_commit(lambda: cache.invalidate_table(sender))
+    transaction.on_commit(cache.invalidate_all)
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=ShoppingCart)
+@receiver((post_save, post_delete), sender=Subscribe)
+def user_marks_changed(sender, instance, **kwargs):
+    user_id = instance.user_id
+    transaction.on_commit(lambda: cache.invalidate_user(user_id))
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_added(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        Recipe.objects.filter(
+            pk=instance.recipe_id).change_favorites_count(1)
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_removed(sender, instance, **kwargs):
+    Recipe.objects.filter(pk=instance.recipe_id).change_favorites_count(-1)
+
+
+@receiver((post_save, post_delete), sender=User)
+def author_changed(sender, instance, created=False, update_fields=None,
+                   **kwargs):
+    """Сброс рецептов автора при изменении его публичных данных."""
+    if created or (
+            update_fields and not USER_PUBLIC_FIELDS & set(update_fields)):
+        return
+    pks = list(instance.recipes.values_list('id', flat=True))
+    transaction.on_commit(lambda: cache.invalidate_recipes(pks))
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, raw=False, **kwargs):
+    """Сброс кэша токенов пользователя: пароль, активность, профиль."""
+    if created or raw:
+        return
+    keys = list(Token.objects.filter(
+        user=instance).values_list('key', flat=True))
+    if keys:
+        transaction.on_commit(lambda: cache.invalidate_tokens(keys))
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    transaction.on_commit(lambda: cache.invalidate_tokens([instance.key]))
+
+
+@receiver(post_save, sender=Subscribe)
+def subscribed(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        FeedEntry.objects.backfill(instance.user, instance.author)
+
+
+@receiver(post_delete, sender=Subscribe)
+def unsubscribed(sender, instance, **kwargs):
+    FeedEntry.objects.trim(instance.user_id, instance.author_id)
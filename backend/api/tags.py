@@ -0,0 +1,60 @@
+from threading import Lock
+
+from api import cache
+from recipes.models import Tag
+
+
+class TagRegistry:
+    """Теги в памяти процесса.
+
+    Тегов мало и меняются они редко, поэтому список тегов, поиск по id
+    и по slug обходятся без запросов к базе. Реестр перечитывается,
+    когда меняется версия таблицы тегов в общем кэше, так что все
+    процессы видят правку.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._version = None
+        self._entries = ((), {}, {})
+
+    def load(self, tags, version=None):
+        tags = tuple(tags)
+        self._entries = (
+            tags,
+            {tag.pk: tag for tag in tags},
+            {tag.slug: tag for tag in tags},
+        )
+        self._version = version
+
+    def refresh(self):
+        version = cache.table_versions(Tag)[0]
+        if version == self._version:
+            return
+        with self._lock:
+            if version != self._version:
+                self.load(Tag.objects.all(), version)
+
+    def all(self):
+        """Все теги в порядке модели."""
+        self.refresh()
+        return list(self._entries[0])
+
+    def get(self, pk):
+        """Тег по id или None."""
+        self.refresh()
+        return self._entries[1].get(pk)
+
+    def ids(self, slugs):
+        """id тегов с указанными slug, неизвестные пропускаются."""
+        self.refresh()
+        by_slug = self._entries[2]
+        return [by_slug[slug].pk for slug in slugs if slug in by_slug]
+
+
+tag_registry = TagRegistry()
+
+
+def tag_choices():
+    """Варианты slug для фильтра рецептов."""
+    return [(tag.slug, tag.name) for tag in tag_registry.all()]
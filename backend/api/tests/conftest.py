@@ -0,0 +1,72 @@
+import base64
+
+import pytest
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, IngredientInRecipe, Recipe, Tag
+from users.models import User
+
+GIF_BASE64 = 'R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7'
+GIF = base64.b64decode(GIF_BASE64)
+
+
+@pytest.fixture(autouse=True)
+def clear_cache(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    cache.clear()
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_user(
+        username='cook', email='cook@example.com', password='Pass-12345',
+        first_name='Иван', last_name='Иванов')
+
+
+@pytest.fixture
+def author(db):
+    return User.objects.create_user(
+        username='author', email='author@example.com', password='Pass-12345',
+        first_name='Пётр', last_name='Петров')
+
+
+@pytest.fixture
+def tags(db):
+    return [Tag.objects.create(name=f'Тег {i}', color=f'#00000{i}',
+                               slug=f'tag-{i}') for i in range(3)]
+
+
+@pytest.fixture
+def ingredients(db):
+    return [Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('молоко', 'мука', 'сахар', 'соль')]
+
+
+@pytest.fixture
+def anon_client():
+    return APIClient()
+
+
+@pytest.fixture
+def user_client(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+@pytest.fixture
+def make_recipe(tags, ingredients):
+    def make_recipe(author, name='Рецепт', amount=10, ingredients=ingredients,
+                    tags=tags):
+        recipe = Recipe.objects.create(
+            author=author, name=name, text='Текст', cooking_time=5,
+            image=ContentFile(GIF, name='recipe.gif'))
+        recipe.tags.set(tags)
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(recipe=recipe, ingredients=ingredient,
+                               amount=amount)
+            for ingredient in ingredients)
+        return recipe
+    return make_recipe
@@ -0,0 +1,77 @@
+import json
+
+import pytest
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from django.core.signals import request_started
+from django.db import close_old_connections
+from rest_framework.authtoken.models import Token
+
+from foodgram.asgi import application
+
+
+@pytest.fixture
+def asgi_get():
+    """GET через ASGI-приложение проекта, как его вызывает сервер.
+
+    Тестовый AsyncClient перебирает потоковые ответы в отдельном
+    потоке, поэтому не показывает ошибок перебора в цикле событий.
+    """
+    def get(path, query='', token=None):
+        headers = [(b'host', b'testserver')]
+        if token is not None:
+            headers.append((b'authorization', f'Token {token}'.encode()))
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'},
+            'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': path, 'raw_path': path.encode(),
+            'query_string': query.encode(), 'headers': headers,
+            'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+        }
+
+        async def run():
+            communicator = ApplicationCommunicator(application, scope)
+            await communicator.send_input(
+                {'type': 'http.request', 'body': b''})
+            start = await communicator.receive_output(5)
+            body = b''
+            while True:
+                message = await communicator.receive_output(5)
+                body += message.get('body', b'')
+                if not message.get('more_body'):
+                    break
+            await communicator.wait()
+            return start['status'], body
+
+        return async_to_sync(run)()
+
+    # Как и тестовый клиент Django, не закрываем соединение с тестовой
+    # базой в начале запроса.
+    request_started.disconnect(close_old_connections)
+    yield get
+    request_started.connect(close_old_connections)
+
+
+def test_download_shopping_cart_over_asgi(user, user_client, author,
+                                          make_recipe, asgi_get):
+    recipe = make_recipe(author)
+    user_client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+    token = Token.objects.create(user=user)
+    status, body = asgi_get('/api/recipes/download_shopping_cart/',
+                            'format=json', token.key)
+    assert status == 200
+    assert {item['name']: item['amount']
+            for item in json.loads(body)} == {
+        'молоко': 10, 'мука': 10, 'сахар': 10, 'соль': 10}
+
+
+def test_export_recipes_over_asgi(author, make_recipe, django_user_model,
+                                  asgi_get):
+    make_recipe(author, name='Блины')
+    admin = django_user_model.objects.create_superuser(
+        username='admin', email='admin@example.com', password='Pass-12345')
+    token = Token.objects.create(user=admin)
+    status, body = asgi_get('/api/recipes/export/', token=token.key)
+    assert status == 200
+    assert [json.loads(line)['name']
+            for line in body.decode().splitlines()] == ['Блины']
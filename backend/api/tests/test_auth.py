@@ -0,0 +1,54 @@
+from django.core.cache import cache as django_cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from api import cache
+from api.authentication import TOKEN_KEY, token_cache
+
+PASSWORD = 'Pass-12345'
+
+
+def login(user):
+    response = APIClient().post('/api/auth/token/login/', {
+        'email': user.email, 'password': PASSWORD})
+    assert response.status_code == 200
+    key = response.json()['auth_token']
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Token {key}')
+    return client, key
+
+
+def test_cached_token_without_password(transactional_db, user):
+    token_cache.clear()
+    client, key = login(user)
+    assert client.get('/api/users/me/').status_code == 200
+    with CaptureQueriesContext(connection) as queries:
+        assert client.get('/api/users/me/').json()['email'] == user.email
+    assert not any('authtoken' in query['sql']
+                   for query in queries.captured_queries)
+
+    record = django_cache.get(
+        TOKEN_KEY.format(key, cache.token_versions(key)[0]))
+    assert record is not None
+    assert user.password not in record[1]
+
+    response = client.post('/api/users/set_password/', {
+        'current_password': PASSWORD, 'new_password': 'New-pass-54321'})
+    assert response.status_code == 204
+    assert client.get('/api/users/me/').status_code == 200
+
+
+def test_logout_invalidates_cached_token(transactional_db, user):
+    client, _ = login(user)
+    assert client.get('/api/users/me/').status_code == 200
+    assert client.post('/api/auth/token/logout/').status_code == 204
+    assert client.get('/api/users/me/').status_code == 401
+
+
+def test_inactive_user_rejected(transactional_db, user):
+    client, _ = login(user)
+    assert client.get('/api/users/me/').status_code == 200
+    user.is_active = False
+    user.save()
+    assert client.get('/api/users/me/').status_code == 401
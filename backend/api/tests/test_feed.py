@@ -0,0 +1,51 @@
+from django.core.management import call_command
+
+from recipes.models import FeedEntry
+
+FEED_URL = '/api/recipes/feed/'
+
+
+def feed_names(client, limit=2):
+    names = []
+    url = f'{FEED_URL}?limit={limit}'
+    while url:
+        page = client.get(url).json()
+        names += [recipe['name'] for recipe in page['results']]
+        url = page['next']
+    return names
+
+
+def test_feed_keyset_pages(user, user_client, author, django_user_model,
+                           make_recipe):
+    other = django_user_model.objects.create_user(
+        username='other', email='other@example.com', password='Pass-12345')
+    make_recipe(author, name='До подписки')
+    user_client.post(f'/api/users/{author.id}/subscribe/')
+    user_client.post(f'/api/users/{other.id}/subscribe/')
+    for index in range(4):
+        make_recipe(author if index % 2 else other, name=f'Рецепт {index}')
+    assert feed_names(user_client) == [
+        'Рецепт 3', 'Рецепт 2', 'Рецепт 1', 'Рецепт 0', 'До подписки']
+
+    first = user_client.get(FEED_URL, {'limit': 2}).json()
+    second = user_client.get(first['next']).json()
+    back = user_client.get(second['previous']).json()
+    assert [recipe['name'] for recipe in back['results']] == [
+        'Рецепт 3', 'Рецепт 2']
+
+    user_client.delete(f'/api/users/{other.id}/subscribe/')
+    assert feed_names(user_client) == ['Рецепт 3', 'Рецепт 1', 'До подписки']
+
+
+def test_rebuild_feeds(user, user_client, author, make_recipe):
+    user_client.post(f'/api/users/{author.id}/subscribe/')
+    make_recipe(author, name='Первый')
+    make_recipe(author, name='Второй')
+    FeedEntry.objects.all().delete()
+    assert feed_names(user_client) == []
+    call_command('rebuild_feeds')
+    assert feed_names(user_client) == ['Второй', 'Первый']
+
+
+def test_feed_requires_auth(anon_client):
+    assert anon_client.get(FEED_URL).status_code == 401
@@ -0,0 +1,66 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from recipes.models import Ingredient, IngredientInRecipe
+
+from .conftest import GIF_BASE64
+
+RECIPES_URL = '/api/recipes/'
+
+
+@pytest.fixture
+def pantry(db):
+    Ingredient.objects.bulk_create(
+        Ingredient(name=f'ингредиент {index:02}', measurement_unit='г')
+        for index in range(60))
+    return list(Ingredient.objects.filter(
+        name__startswith='ингредиент').order_by('name'))
+
+
+def payload(tags, ingredients, amount=10):
+    return {
+        'name': 'Рецепт', 'text': 'Текст', 'cooking_time': 5,
+        'image': f'data:image/gif;base64,{GIF_BASE64}',
+        'tags': [tag.id for tag in tags],
+        'ingredients': [{'id': ingredient.id, 'amount': amount}
+                        for ingredient in ingredients],
+    }
+
+
+def write_queries(client, tags, pantry, size):
+    """Запросы создания рецепта и его обновления с заменой половины."""
+    with CaptureQueriesContext(connection) as created:
+        response = client.post(
+            RECIPES_URL, payload(tags, pantry[:size]), format='json')
+    assert response.status_code == 201
+    recipe_id = response.json()['id']
+    half = size // 2
+    changed = pantry[:half] + pantry[size:size + size - half]
+    with CaptureQueriesContext(connection) as updated:
+        response = client.patch(
+            f'{RECIPES_URL}{recipe_id}/', payload(tags, changed, 20),
+            format='json')
+    assert response.status_code == 200
+    assert IngredientInRecipe.objects.filter(
+        recipe_id=recipe_id, amount=20).count() == size
+    return len(created), len(updated)
+
+
+def test_ingredient_writes_do_not_grow_with_ingredients(user_client, tags,
+                                                        pantry):
+    # Первый запрос заполняет реестр тегов и другие кэши процесса.
+    write_queries(user_client, tags, pantry, 2)
+    assert write_queries(user_client, tags, pantry, 5) == write_queries(
+        user_client, tags, pantry, 30)
+
+
+def test_duplicate_ingredients_are_summed(user_client, tags, ingredients):
+    milk, flour, *_ = ingredients
+    data = payload(tags, [milk, flour, milk])
+    data['ingredients'][2]['amount'] = 5
+    response = user_client.post(RECIPES_URL, data, format='json')
+    assert response.status_code == 201
+    assert {item['name']: item['amount']
+            for item in response.json()['ingredients']} == {
+        'молоко': 15, 'мука': 10}
@@ -0,0 +1,106 @@
+import time
+
+import pytest
+from django.core.cache import cache as django_cache
+
+from api import cache
+from users.models import Subscribe
+
+RECIPES_URL = '/api/recipes/'
+
+
+@pytest.mark.parametrize('page_size', [1, 6])
+def test_recipe_list_queries_anonymous(
+        anon_client, author, make_recipe, django_assert_num_queries,
+        page_size):
+    for index in range(page_size):
+        make_recipe(author, name=f'Рецепт {index}')
+    with django_assert_num_queries(4):
+        response = anon_client.get(RECIPES_URL, {'limit': page_size})
+    assert len(response.json()['results']) == page_size
+
+
+@pytest.mark.parametrize('page_size', [1, 6])
+def test_recipe_list_queries_authenticated(
+        user, user_client, author, make_recipe, django_assert_num_queries,
+        page_size):
+    Subscribe.objects.create(user=user, author=author)
+    for index in range(page_size):
+        make_recipe(author if index % 2 else user, name=f'Рецепт {index}')
+    with django_assert_num_queries(7):
+        response = user_client.get(RECIPES_URL, {'limit': page_size})
+    results = response.json()['results']
+    assert len(results) == page_size
+    assert {recipe['author']['is_subscribed'] for recipe in results} == (
+        {False, True} if page_size > 1 else {False})
+
+
+def test_recipe_cache_invalidated_after_commit(
+        anon_client, author, make_recipe,
+        django_capture_on_commit_callbacks):
+    recipe = make_recipe(author, name='Старое')
+    url = f'{RECIPES_URL}{recipe.id}/'
+    assert anon_client.get(url).json()['name'] == 'Старое'
+    assert anon_client.get(RECIPES_URL).json()['results'][0][
+        'name'] == 'Старое'
+    with django_capture_on_commit_callbacks(execute=True):
+        recipe.name = 'Новое'
+        recipe.save()
+        assert anon_client.get(url).json()['name'] == 'Старое'
+        assert anon_client.get(RECIPES_URL).json()['results'][0][
+            'name'] == 'Старое'
+    assert anon_client.get(url).json()['name'] == 'Новое'
+    assert anon_client.get(RECIPES_URL).json()['results'][0][
+        'name'] == 'Новое'
+
+
+def test_interactions_cache_invalidated_after_commit(
+        user_client, author, make_recipe, settings,
+        django_capture_on_commit_callbacks):
+    settings.INTERACTIONS_CACHE = True
+    recipe = make_recipe(author)
+    url = f'{RECIPES_URL}{recipe.id}/'
+    assert user_client.get(url).json()['is_favorited'] is False
+    with django_capture_on_commit_callbacks(execute=True):
+        user_client.post(f'{url}favorite/')
+        assert user_client.get(url).json()['is_favorited'] is False
+    assert user_client.get(url).json()['is_favorited'] is True
+    with django_capture_on_commit_callbacks(execute=True):
+        user_client.post(f'{RECIPES_URL}favorite/batch/',
+                         {'ids': [recipe.id]}, format='json')
+        user_client.delete(f'{RECIPES_URL}favorite/batch/',
+                           {'ids': [recipe.id]}, format='json')
+    assert user_client.get(url).json()['is_favorited'] is False
+
+
+def test_recipe_version_keys_are_bounded(anon_client, monkeypatch, db):
+    assert anon_client.get(f'{RECIPES_URL}abc/').status_code == 404
+    assert django_cache.get(cache.RECIPE_VERSION_KEY.format('abc')) is None
+    assert anon_client.get(f'{RECIPES_URL}999/').status_code == 404
+    key = cache.RECIPE_VERSION_KEY.format(999)
+    assert django_cache.get(key) is not None
+    expired = time.time() + cache.RECIPE_VERSION_TIMEOUT + 1
+    monkeypatch.setattr(time, 'time', lambda: expired)
+    assert django_cache.get(key) is None
+
+
+@pytest.mark.parametrize('query', ['блины', 'блинами', 'блинов'])
+def test_recipe_search_inflections(anon_client, author, make_recipe, query):
+    make_recipe(author, name='Блины на молоке')
+    make_recipe(author, name='Сырники')
+    results = anon_client.get(RECIPES_URL, {'search': query}).json()[
+        'results']
+    assert [recipe['name'] for recipe in results] == ['Блины на молоке']
+
+
+@pytest.mark.parametrize('params', [
+    {'search': 'блины'}, {'ordering': '-favorites_count'}])
+def test_recipe_cursor_rejects_reordering(anon_client, author, make_recipe,
+                                          params):
+    make_recipe(author)
+    response = anon_client.get(RECIPES_URL, {'cursor': '', **params})
+    assert response.status_code == 400
+    assert set(response.json()) == set(params)
+    response = anon_client.get(RECIPES_URL, {'cursor': ''})
+    assert response.status_code == 200
+    assert 'count' not in response.json()
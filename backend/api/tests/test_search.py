@@ -0,0 +1,63 @@
+import base64
+
+import pytest
+
+from api.search import ingredient_recipe_index
+from api.tests.conftest import GIF
+
+RECIPES_URL = '/api/recipes/'
+BY_INGREDIENTS_URL = '/api/recipes/by-ingredients/'
+
+
+def recipe_data(tags, ingredients, name):
+    return {
+        'ingredients': [{'id': ingredient.id, 'amount': 10}
+                        for ingredient in ingredients],
+        'tags': [tag.id for tag in tags],
+        'image': 'data:image/gif;base64,' + base64.b64encode(GIF).decode(),
+        'name': name, 'text': 'Текст', 'cooking_time': 5,
+    }
+
+
+def matches(client, ingredients):
+    response = client.get(BY_INGREDIENTS_URL, {
+        'ids': ','.join(str(ingredient.id) for ingredient in ingredients)})
+    return {recipe['name']: (recipe['matched'], recipe['missing'])
+            for recipe in response.json()['results']}
+
+
+@pytest.fixture
+def no_full_reload(monkeypatch):
+    def enable():
+        def load(*args, **kwargs):
+            raise AssertionError('индекс перестроен целиком')
+        monkeypatch.setattr(ingredient_recipe_index, 'load', load)
+    return enable
+
+
+def test_ingredient_index_applies_recipe_changes(
+        user_client, author, tags, ingredients, make_recipe, no_full_reload,
+        django_capture_on_commit_callbacks):
+    milk, flour, sugar, salt = ingredients
+    make_recipe(author, name='Старый', ingredients=[milk, salt])
+    assert matches(user_client, [milk]) == {'Старый': (1, 1)}
+    no_full_reload()
+
+    with django_capture_on_commit_callbacks(execute=True):
+        recipe = user_client.post(
+            RECIPES_URL, recipe_data(tags, [milk, flour], 'Блины'),
+            format='json').json()
+    assert matches(user_client, [milk, flour]) == {
+        'Блины': (2, 0), 'Старый': (1, 1)}
+
+    with django_capture_on_commit_callbacks(execute=True):
+        user_client.patch(
+            f'{RECIPES_URL}{recipe["id"]}/',
+            recipe_data(tags, [flour, sugar, salt], 'Блины'), format='json')
+    assert matches(user_client, [milk, flour]) == {
+        'Блины': (1, 2), 'Старый': (1, 1)}
+    assert matches(user_client, [sugar]) == {'Блины': (1, 2)}
+
+    with django_capture_on_commit_callbacks(execute=True):
+        user_client.delete(f'{RECIPES_URL}{recipe["id"]}/')
+    assert matches(user_client, [flour, sugar, salt]) == {'Старый': (1, 1)}
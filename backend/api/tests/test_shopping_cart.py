@@ -0,0 +1,113 @@
+import json
+
+import pytest
+from django.core.management import call_command
+
+from recipes.models import (Favorite, IngredientInRecipe, Recipe,
+                            ShoppingCartIngredient)
+
+RECIPES_URL = '/api/recipes/'
+DOWNLOAD_URL = '/api/recipes/download_shopping_cart/'
+
+
+def download(client):
+    response = client.get(DOWNLOAD_URL, {'format': 'json'})
+    assert response.status_code == 200
+    return {item['name']: item['amount']
+            for item in json.loads(b''.join(response.streaming_content))}
+
+
+def test_shopping_cart_totals(user, user_client, author, ingredients,
+                              make_recipe):
+    milk, flour, sugar, _ = ingredients
+    first = make_recipe(user, ingredients=[milk, flour])
+    second = make_recipe(author, ingredients=[flour, sugar], amount=5)
+    user_client.post(f'{RECIPES_URL}{first.id}/shopping_cart/')
+    user_client.post(f'{RECIPES_URL}{second.id}/shopping_cart/')
+    assert download(user_client) == {'молоко': 10, 'мука': 15, 'сахар': 5}
+
+    user_client.delete(f'{RECIPES_URL}{second.id}/shopping_cart/')
+    assert download(user_client) == {'молоко': 10, 'мука': 10}
+
+    user_client.post(f'{RECIPES_URL}{second.id}/shopping_cart/')
+    assert user_client.delete(f'{RECIPES_URL}{first.id}/').status_code == 204
+    assert download(user_client) == {'мука': 5, 'сахар': 5}
+
+
+def test_shopping_cart_skips_rows_without_ingredient(user_client, author,
+                                                     make_recipe):
+    recipe = make_recipe(author)
+    IngredientInRecipe.objects.create(recipe=recipe, ingredients=None,
+                                      amount=1)
+    expected = {'молоко': 10, 'мука': 10, 'сахар': 10, 'соль': 10}
+    response = user_client.post(f'{RECIPES_URL}{recipe.id}/shopping_cart/')
+    assert response.status_code == 201
+    assert download(user_client) == expected
+    user_client.delete(f'{RECIPES_URL}{recipe.id}/shopping_cart/')
+    assert download(user_client) == {}
+
+
+def test_rebuild_shopping_carts(user, user_client, author, make_recipe):
+    recipe = make_recipe(author)
+    user_client.post(f'{RECIPES_URL}{recipe.id}/shopping_cart/')
+    expected = download(user_client)
+    ShoppingCartIngredient.objects.all().delete()
+    assert download(user_client) == {}
+    call_command('rebuild_shopping_carts')
+    assert download(user_client) == expected
+
+
+def test_batch_marks(user_client, author, ingredients, make_recipe):
+    milk, flour, sugar, _ = ingredients
+    first = make_recipe(author, ingredients=[milk, flour])
+    second = make_recipe(author, ingredients=[flour, sugar], amount=5)
+    missing = second.id + 100
+    user_client.post(f'{RECIPES_URL}{first.id}/favorite/')
+
+    response = user_client.post(
+        f'{RECIPES_URL}favorite/batch/',
+        {'ids': [first.id, second.id, missing]}, format='json')
+    assert response.json() == {
+        'applied': [second.id], 'already': [first.id], 'missing': [missing]}
+    results = user_client.get(RECIPES_URL).json()['results']
+    assert all(recipe['is_favorited'] for recipe in results)
+    first.refresh_from_db()
+    second.refresh_from_db()
+    assert (first.favorites_count, second.favorites_count) == (1, 1)
+
+    response = user_client.delete(
+        f'{RECIPES_URL}favorite/batch/', {'ids': [second.id]}, format='json')
+    assert response.json() == {
+        'applied': [second.id], 'already': [], 'missing': []}
+
+    user_client.post(f'{RECIPES_URL}shopping_cart/batch/',
+                     {'ids': [first.id, second.id]}, format='json')
+    assert download(user_client) == {'молоко': 10, 'мука': 15, 'сахар': 5}
+    response = user_client.delete(
+        f'{RECIPES_URL}shopping_cart/batch/',
+        {'ids': [second.id, missing]}, format='json')
+    assert response.json() == {
+        'applied': [second.id], 'already': [], 'missing': [missing]}
+    assert download(user_client) == {'молоко': 10, 'мука': 10}
+
+    response = user_client.post(
+        f'{RECIPES_URL}favorite/batch/', {'ids': []}, format='json')
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('size', [1, 50])
+def test_batch_unfavorite_queries(user, user_client, author, make_recipe,
+                                  django_assert_num_queries, size):
+    recipes = [make_recipe(author, name=f'Рецепт {index}', ingredients=[],
+                           tags=[])
+               for index in range(size)]
+    ids = [recipe.id for recipe in recipes]
+    user_client.post(f'{RECIPES_URL}favorite/batch/', {'ids': ids},
+                     format='json')
+    with django_assert_num_queries(6):
+        response = user_client.delete(f'{RECIPES_URL}favorite/batch/',
+                                      {'ids': ids}, format='json')
+    assert response.json()['applied'] == ids
+    assert not Favorite.objects.filter(user=user).exists()
+    assert set(Recipe.objects.values_list('favorites_count', flat=True)) == {
+        0}
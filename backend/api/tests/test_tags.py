@@ -0,0 +1,27 @@
+from api import cache
+from recipes.models import Tag
+
+TAGS_URL = '/api/tags/'
+
+
+def test_tags_served_from_registry(anon_client, tags,
+                                   django_assert_num_queries):
+    anon_client.get(TAGS_URL)
+    with django_assert_num_queries(0):
+        response = anon_client.get(TAGS_URL)
+        detail = anon_client.get(f'{TAGS_URL}{tags[0].id}/')
+    assert [tag['slug'] for tag in response.json()] == list(
+        Tag.objects.values_list('slug', flat=True))
+    assert detail.json()['name'] == tags[0].name
+
+
+def test_tag_change_bumps_registry(anon_client, tags,
+                                   django_capture_on_commit_callbacks):
+    anon_client.get(TAGS_URL)
+    version = cache.table_versions(Tag)
+    with django_capture_on_commit_callbacks(execute=True):
+        tags[0].name = 'Завтрак'
+        tags[0].save()
+    assert cache.table_versions(Tag) != version
+    names = [tag['name'] for tag in anon_client.get(TAGS_URL).json()]
+    assert 'Завтрак' in names
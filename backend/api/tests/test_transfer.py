@@ -0,0 +1,58 @@
+import json
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from recipes.models import FeedEntry, Recipe
+from users.models import Subscribe
+
+
+def test_export_import_keeps_pub_dates(user, author, make_recipe):
+    for index in range(3):
+        recipe = make_recipe(author, name=f'Рецепт {index}', amount=index + 1)
+        Recipe.objects.filter(pk=recipe.pk).update(
+            pub_date=timezone.now() - timedelta(days=index + 1))
+    exported = {(recipe.name, recipe.pub_date)
+                for recipe in Recipe.objects.all()}
+    out = StringIO()
+    call_command('export_recipes', '--batch-size', '2', stdout=out,
+                 stderr=StringIO())
+    lines = out.getvalue().splitlines()
+    assert len(lines) == 3
+    assert {json.loads(line)['name'] for line in lines} == {
+        name for name, _ in exported}
+
+    Recipe.objects.all().delete()
+    Subscribe.objects.create(user=user, author=author)
+    call_command('import_recipes', '--batch-size', '2',
+                 stdin=StringIO(out.getvalue()), stdout=StringIO())
+    assert {(recipe.name, recipe.pub_date)
+            for recipe in Recipe.objects.all()} == exported
+    assert Recipe._meta.get_field('pub_date').auto_now_add
+    assert FeedEntry.objects.filter(user=user).count() == 3
+
+    call_command('import_recipes', stdin=StringIO(out.getvalue()),
+                 stdout=StringIO())
+    assert Recipe.objects.count() == 3
+
+
+def test_import_api_reports_throughput(author, make_recipe,
+                                       django_user_model):
+    make_recipe(author)
+    out = StringIO()
+    call_command('export_recipes', stdout=out, stderr=StringIO())
+    Recipe.objects.all().delete()
+    admin = django_user_model.objects.create_superuser(
+        username='admin', email='admin@example.com', password='Pass-12345')
+    client = APIClient()
+    client.force_authenticate(admin)
+    response = client.generic(
+        'POST', '/api/recipes/import/', out.getvalue().encode(),
+        content_type='application/x-ndjson')
+    assert response.status_code == 200
+    stats = response.json()
+    assert (stats['line'], stats['created'], stats['skipped']) == (1, 1, 0)
+    assert stats['elapsed'] >= 0 and stats['rate'] > 0
@@ -1,6 +1,8 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework import routers
 
+from api.async_views import with_async_reads
 from api.views import (IngredientViewSet, RecipeViewSet, SetPasswordView,
                        TagViewSet, UsersViewSet)
 
@@ -13,8 +15,12 @@ router.register('tags', TagViewSet, basename='tags')
 router.register('ingredients', IngredientViewSet, basename='ingredients')
 router.register('recipes', RecipeViewSet, basename='recipes')
 
+router_urls = router.urls
+if settings.ASYNC_READ_VIEWS:
+    router_urls = with_async_reads(router_urls)
+
 urlpatterns = [
-    path('', include(router.urls)),
+    path('', include(router_urls)),
     path('', include('djoser.urls')),
     path('users/set_password/', SetPasswordView, name='set_password'),
     path('auth/', include('djoser.urls.authtoken'), name='auth'),
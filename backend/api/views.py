@@ -1,27 +1,60 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, OuterRef, Prefetch
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework import filters, permissions, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
 from rest_framework.generics import get_object_or_404
 from rest_framework.pagination import PageNumberPagination
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import (AllowAny, IsAdminUser,
+                                        IsAuthenticated)
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from api.filters import IngredientSearchFilter, RecipesFilter
+from api import cache
+from api.filters import RecipeOrderingFilter, RecipesFilter
+from api.pagination import (FeedPagination, LimitPagination,
+                            RecipePagination)
 from api.permissions import AdminOrAuthor, AdminOrReadOnly
+from api.search import recipes_by_ingredients, search_ingredients
 from api.serializers import (FollowSerializer, IngredientSerializer,
                              RecipeCreateSerializer,
-                             RecipeForFollowersSerializer, RecipeSerializer,
+                             RecipeForFollowersSerializer,
+                             RecipeIdsSerializer, RecipeSerializer,
                              TagSerializer, UserPasswordSerializer,
                              UsersSerializer)
-from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
-                            ShoppingCart, Tag)
+from api.services import (SHOPPING_LIST_FORMATS, recipes_export_response,
+                          shopping_cart_ingredients, shopping_list_response)
+from api.tags import tag_registry
+from recipes.models import (Favorite, FeedEntry, Ingredient,
+                            IngredientInRecipe, Recipe, ShoppingCart,
+                            ShoppingCartIngredient, Tag)
+from recipes.transfer import RecipeImporter, TransferError
 from users.models import Subscribe, User
 
 
+def table_condition(model):
+    """Условный GET по версии таблицы модели."""
+    return method_decorator(condition(
+        etag_func=lambda request, *args, **kwargs: cache.versions_etag(
+            cache.table_versions(model)),
+        last_modified_func=lambda request, *args, **kwargs: (
+            cache.versions_last_modified(cache.table_versions(model))),
+    ))
+
+
+recipe_condition = method_decorator(condition(
+    etag_func=lambda request, pk, **kwargs: cache.versions_etag(
+        cache.recipe_versions(request, pk)),
+    last_modified_func=lambda request, pk, **kwargs: (
+        cache.versions_last_modified(cache.recipe_versions(request, pk))),
+))
+
+
 class UsersViewSet(UserViewSet):
     """Вьюсет для модели пользователей."""
     queryset = User.objects.all()
@@ -31,6 +64,32 @@ class UsersViewSet(UserViewSet):
     search_fields = ('username', 'email')
     permission_classes = (AllowAny, )
 
+    def get_recipes_limit(self):
+        try:
+            limit = int(self.request.query_params['recipes_limit'])
+        except (KeyError, ValueError):
+            return settings.MAX_ITEM_PER_PAGE
+        return min(max(limit, 0), settings.MAX_ITEM_PER_PAGE)
+
+    def get_subscriptions(self):
+        """Подписки с числом рецептов и последними recipes_limit рецептами.
+
+        Последние рецепты каждого автора выбираются одним запросом:
+        коррелированный подзапрос с LIMIT по автору.
+        """
+        latest = Recipe.objects.filter(
+            id__in=Recipe.objects.filter(
+                author=OuterRef('author'),
+            ).order_by('-pub_date', '-id').values('id')[
+                :self.get_recipes_limit()],
+        ).order_by('-pub_date', '-id')
+        return Subscribe.objects.filter(
+            user=self.request.user,
+        ).select_related('author').annotate(
+            recipes_count=Count('author__recipes'),
+        ).order_by('-id').prefetch_related(Prefetch(
+            'author__recipes', queryset=latest, to_attr='latest_recipes'))
+
     def subscribed(self, serializer, id=None):
         follower = get_object_or_404(User, id=id)
         if self.request.user == follower:
@@ -38,7 +97,8 @@ class UsersViewSet(UserViewSet):
                             status=status.HTTP_400_BAD_REQUEST)
         follow = Subscribe.objects.get_or_create(user=self.request.user,
                                                  author=follower)
-        serializer = FollowSerializer(follow[0])
+        serializer = FollowSerializer(
+            self.get_subscriptions().get(pk=follow[0].pk))
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def unsubscribed(self, serializer, id=None):
@@ -58,7 +118,7 @@ class UsersViewSet(UserViewSet):
     @action(detail=False, methods=['get'],
             permission_classes=[permissions.IsAuthenticated])
     def subscriptions(self, serializer):
-        following = Subscribe.objects.filter(user=self.request.user)
+        following = self.get_subscriptions()
         pages = self.paginate_queryset(following)
         serializer = FollowSerializer(pages, many=True)
         return self.get_paginated_response(serializer.data)
@@ -71,6 +131,21 @@ class TagViewSet(viewsets.ModelViewSet):
     pagination_class = None
     permission_classes = (AdminOrReadOnly,)
 
+    @table_condition(Tag)
+    def list(self, request, *args, **kwargs):
+        return Response(
+            self.get_serializer(tag_registry.all(), many=True).data)
+
+    @table_condition(Tag)
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            tag = tag_registry.get(int(kwargs[self.lookup_field]))
+        except ValueError:
+            tag = None
+        if tag is None:
+            raise NotFound
+        return Response(self.get_serializer(tag).data)
+
 
 class IngredientViewSet(viewsets.ModelViewSet):
     """Вьюсет для модели ингредиентов."""
@@ -78,38 +153,155 @@ class IngredientViewSet(viewsets.ModelViewSet):
     serializer_class = IngredientSerializer
     permission_classes = (AdminOrReadOnly,)
     pagination_class = None
-    filter_backends = (IngredientSearchFilter,)
-    search_fields = ('^name',)
+
+    @table_condition(Ingredient)
+    def list(self, request, *args, **kwargs):
+        """Поиск по началу названия или с опечатками (fuzzy=1)."""
+        try:
+            limit = int(request.query_params['limit'])
+        except (KeyError, ValueError):
+            limit = None
+        return Response(search_ingredients(
+            request.query_params.get('name', ''), limit,
+            fuzzy=request.query_params.get('fuzzy') in ('1', 'true')))
+
+    @table_condition(Ingredient)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
     """Вьюсет для рецептов."""
-    queryset = Recipe.objects.all()
     permission_classes = (AdminOrAuthor,)
-    pagination_class = PageNumberPagination
-    filter_backends = (DjangoFilterBackend,)
+    pagination_class = RecipePagination
+    filter_backends = (DjangoFilterBackend, RecipeOrderingFilter)
     filterset_class = RecipesFilter
+    ordering_fields = ('favorites_count', 'pub_date')
+    # Только числовые id: по id из адреса создаётся версия в кэше.
+    lookup_value_regex = r'\d+'
+
+    def get_queryset(self):
+        if self.action in ('list', 'retrieve', 'trending'):
+            return Recipe.objects.with_related()
+        return Recipe.objects.all()
 
     def get_serializer_class(self):
         if self.action == 'list':
             return RecipeSerializer
-        if self.action == 'retrieve':
+        if self.action in ('retrieve', 'feed', 'trending',
+                           'by_ingredients'):
             return RecipeSerializer
         return RecipeCreateSerializer
 
+    def list(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().list(request, *args, **kwargs)
+        key = cache.list_key(request)
+        data = cache.get_cached(key)
+        if data is not None:
+            return Response(data)
+        response = super().list(request, *args, **kwargs)
+        cache.set_cached(key, response.data)
+        return response
+
+    @recipe_condition
+    def retrieve(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().retrieve(request, *args, **kwargs)
+        key = cache.detail_key(request, kwargs[self.lookup_field])
+        data = cache.get_cached(key)
+        if data is not None:
+            return Response(data)
+        response = super().retrieve(request, *args, **kwargs)
+        cache.set_cached(key, response.data)
+        return response
+
+    @action(detail=False, methods=['get'],
+            permission_classes=[IsAdminUser])
+    def cache_stats(self, request):
+        """Счётчики попаданий и промахов кэша рецептов."""
+        return Response(cache.get_stats())
+
+    @action(detail=False, methods=['get'],
+            permission_classes=[IsAuthenticated])
+    def feed(self, request):
+        """Новые рецепты авторов, на которых подписан пользователь."""
+        paginator = FeedPagination()
+        rows = paginator.paginate_sources(
+            FeedEntry.objects.sources(request.user), request)
+        recipes = Recipe.objects.with_related().in_bulk(
+            [row.id for row in rows])
+        serializer = self.get_serializer(
+            [recipes[row.id] for row in rows if row.id in recipes],
+            many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['get'], pagination_class=LimitPagination)
+    def trending(self, request):
+        """Популярные рецепты по рейтингу, который считает rank_trending."""
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            trending__isnull=False).order_by('-trending__score', '-id')
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['get'], url_path='by-ingredients',
+            pagination_class=LimitPagination)
+    def by_ingredients(self, request):
+        """Рецепты из имеющихся ингредиентов: ?ids=1,2,3 или ?ids=1&ids=2.
+
+        Сначала рецепты, для которых не хватает меньше ингредиентов,
+        затем с большей долей имеющихся.
+        """
+        try:
+            ids = {int(pk) for value in request.query_params.getlist('ids')
+                   for pk in value.split(',') if pk.strip()}
+        except ValueError:
+            return Response({'errors': 'ids — список id ингредиентов'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not ids:
+            return Response({'errors': 'Укажите ингредиенты в ids'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        page = self.paginate_queryset(recipes_by_ingredients(ids))
+        recipes = Recipe.objects.with_related().in_bulk(
+            [recipe_id for recipe_id, *_ in page])
+        results = []
+        for recipe_id, matched, missing in page:
+            if recipe_id not in recipes:
+                continue
+            data = self.get_serializer(recipes[recipe_id]).data
+            data['matched'] = matched
+            data['missing'] = missing
+            results.append(data)
+        return self.get_paginated_response(results)
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
     def perform_update(self, serializer):
         serializer.save(author=self.request.user)
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        users = list(User.objects.filter(
+            shopping_cart__recipe=instance).values_list('id', flat=True))
+        ingredients = list(instance.recipe_ingredients.values_list(
+            'ingredients_id', flat=True))
+        instance.delete()
+        if users:
+            ShoppingCartIngredient.objects.rebuild(users, ingredients)
+
     @action(detail=True, methods=['post', 'delete'],
             permission_classes=[IsAuthenticated])
+    @transaction.atomic
     def favorite(self, request, pk):
         recipe = get_object_or_404(Recipe, pk=pk)
         if request.method == 'POST':
-            Favorite.objects.create(user=request.user,
-                                    recipe=recipe)
+            _, created = Favorite.objects.get_or_create(
+                user=request.user, recipe=recipe)
+            if not created:
+                return Response({'message': 'Рецепт уже в избранном'},
+                                status=status.HTTP_400_BAD_REQUEST)
             serializer = RecipeForFollowersSerializer(recipe)
             return Response(data=serializer.data,
                             status=status.HTTP_201_CREATED)
@@ -122,11 +314,16 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['post', 'delete'],
             permission_classes=[IsAuthenticated])
+    @transaction.atomic
     def shopping_cart(self, request, pk):
         recipe = get_object_or_404(Recipe, pk=pk)
         if request.method == 'POST':
-            ShoppingCart.objects.create(user=request.user,
-                                        recipe=recipe)
+            _, created = ShoppingCart.objects.get_or_create(
+                user=request.user, recipe=recipe)
+            if not created:
+                return Response({'message': 'Рецепт уже в списке покупок'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            ShoppingCartIngredient.objects.add_recipe(request.user, recipe)
             serializer = RecipeForFollowersSerializer(recipe)
             return Response(data=serializer.data,
                             status=status.HTTP_201_CREATED)
@@ -134,29 +331,113 @@ class RecipeViewSet(viewsets.ModelViewSet):
                                     user=request.user,
                                     recipe=recipe)
         deleted.delete()
+        ShoppingCartIngredient.objects.remove_recipe(request.user, recipe)
         return Response({'message': 'Рецепт успешно удален из списка покупок'},
                         status=status.HTTP_200_OK)
 
-    @action(detail=False, methods=['get'])
-    def download_shopping_cart(self, request):
-        user = request.user
-        ingredients = IngredientInRecipe.objects.filter(
-            recipe__shopping_cart__user=user).values(
-                'ingredients__name',
-                'ingredients__measurement_unit').annotate(
-                    amount=Sum('amount'))
-        data = ingredients.values_list('ingredients__name',
-                                       'ingredients__measurement_unit',
-                                       'amount')
-        shopping_cart = 'Список покупок:\n'
-        for name, measure, amount in data:
-            shopping_cart += (f'{name.capitalize()} {amount} {measure},\n')
-        response = HttpResponse(shopping_cart, content_type='text/plain')
-        filename = 'shopping_list.txt'
-        response['Content-Disposition'] = (
-            f'attachment; filename={0}'.format(filename))
+    def batch_marks(self, request, model):
+        """Пакетное добавление или удаление рецептов из списка model."""
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = set(serializer.validated_data['ids'])
+        found = set(Recipe.objects.filter(
+            id__in=ids).values_list('id', flat=True))
+        marks = model.objects.filter(user=request.user, recipe_id__in=found)
+        present = set(marks.values_list('recipe_id', flat=True))
+        if request.method == 'POST':
+            applied, already = found - present, present
+            model.objects.bulk_create(
+                (model(user=request.user, recipe_id=recipe_id)
+                 for recipe_id in applied),
+                ignore_conflicts=True)
+        else:
+            applied, already = present, found - present
+            # Удаление одним запросом, без сигналов post_delete по
+            # строкам: версию пользователя и счётчики меняем ниже.
+            marks._raw_delete(marks.db)
+        if applied:
+            user_id = request.user.pk
+            transaction.on_commit(lambda: cache.invalidate_user(user_id))
+            if model is Favorite:
+                # bulk_create и удаление без сигналов не меняют счётчик.
+                Recipe.objects.filter(id__in=applied).change_favorites_count(
+                    1 if request.method == 'POST' else -1)
+        return Response({
+            'applied': sorted(applied),
+            'already': sorted(already),
+            'missing': sorted(ids - found),
+        }, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post', 'delete'],
+            url_path='favorite/batch',
+            permission_classes=[IsAuthenticated])
+    @transaction.atomic
+    def favorite_batch(self, request):
+        return self.batch_marks(request, Favorite)
+
+    @action(detail=False, methods=['post', 'delete'],
+            url_path='shopping_cart/batch',
+            permission_classes=[IsAuthenticated])
+    @transaction.atomic
+    def shopping_cart_batch(self, request):
+        response = self.batch_marks(request, ShoppingCart)
+        if response.data['applied']:
+            ShoppingCartIngredient.objects.rebuild(
+                [request.user.pk],
+                IngredientInRecipe.objects.filter(
+                    recipe__in=response.data['applied'],
+                ).values('ingredients_id'))
         return response
 
+    def perform_content_negotiation(self, request, force=False):
+        # Параметр format у выгрузки списка покупок задаёт формат файла,
+        # а не рендерер DRF; выгрузка рецептов всегда в NDJSON.
+        return super().perform_content_negotiation(
+            request, force=force or self.action in (
+                'download_shopping_cart', 'export_recipes'))
+
+    @action(detail=False, methods=['get'], url_path='export',
+            permission_classes=[IsAdminUser])
+    def export_recipes(self, request):
+        """Выгрузка рецептов в NDJSON; ?hash=1 добавляет sha256 фото."""
+        return recipes_export_response(
+            request,
+            with_hashes=request.query_params.get('hash') in ('1', 'true'))
+
+    @action(detail=False, methods=['post'], url_path='import',
+            permission_classes=[IsAdminUser])
+    def import_recipes(self, request):
+        """Загрузка рецептов из NDJSON в теле запроса.
+
+        Тело читается построчно, без разбора целиком. ?skip=N пропускает
+        первые N строк, чтобы продолжить прерванную загрузку.
+        """
+        try:
+            skip = max(int(request.query_params.get('skip', 0)), 0)
+        except ValueError:
+            return Response({'errors': 'skip — число строк'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        stream = request.stream
+        importer = RecipeImporter()
+        try:
+            importer.run(iter(stream.readline, b'') if stream else (), skip)
+        except TransferError as err:
+            return Response({'errors': str(err), **importer.stats()},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(importer.stats(), status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'],
+            permission_classes=[IsAuthenticated])
+    def download_shopping_cart(self, request):
+        file_format = request.query_params.get('format', 'txt')
+        if file_format not in SHOPPING_LIST_FORMATS:
+            return Response(
+                {'errors': 'Доступные форматы: '
+                           f'{", ".join(SHOPPING_LIST_FORMATS)}'},
+                status=status.HTTP_400_BAD_REQUEST)
+        return shopping_list_response(
+            request, shopping_cart_ingredients(request.user), file_format)
+
 
 class SetPasswordView(APIView):
     def post(self, request):
@@ -10,9 +10,25 @@ ITEM_PER_PAGE_ADMIN = 20
 
 # Recipes apps
 DEFAULT_ITEM_PER_PAGE = 6
+MAX_ITEM_PER_PAGE = 100
+MAX_RECIPES_IN_BATCH = 100
 MAX_LEN_RECIPES = 200
 MIN_INGREDIENT_AMOUNT = 1
 MAX_INGREDIENT_AMOUNT = 10000
+RECIPE_CACHE_TIMEOUT = 60 * 5
+# Лента подписок: авторов с большим числом подписчиков читаем напрямую
+FEED_FANOUT_MAX_FOLLOWERS = 10000
+FEED_BACKFILL_SIZE = 100
+FEED_PULL_AUTHORS_TIMEOUT = 60 * 10
+# Рейтинг популярных рецептов: окно и период полураспада, в часах
+TRENDING_WINDOW_HOURS = 24 * 7
+TRENDING_HALF_LIFE_HOURS = 48
+TRENDING_FAVORITE_WEIGHT = 1
+TRENDING_SHOPPING_CART_WEIGHT = 2
+# Кэш токенов авторизации: время жизни записи в секундах и размер
+# LRU в памяти процесса
+AUTH_TOKEN_CACHE_TIMEOUT = 60 * 5
+AUTH_TOKEN_CACHE_SIZE = 10000
 MIN_COOKING_TIME = 1
 MAX_COOKING_TIME = 1441  # 24 hours + 1 minute
 LEN_HEX_CODE = 7
@@ -40,6 +56,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'djoser',
@@ -91,6 +108,25 @@ DATABASES = {
     }
 }
 
+# Поиск ингредиентов с опечатками: 'memory' или 'postgres' (pg_trgm)
+INGREDIENT_SEARCH_BACKEND = os.getenv('INGREDIENT_SEARCH_BACKEND', 'memory')
+
+# Хранить множества отметок пользователя в общем кэше
+INTERACTIONS_CACHE = os.getenv('INTERACTIONS_CACHE') == 'True'
+
+# Асинхронные view для чтения рецептов, ингредиентов и тегов; включает
+# foodgram/asgi.py, под WSGI они только добавили бы накладные расходы.
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS') == 'True'
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'foodgram'),
+    }
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -126,7 +162,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -48,9 +48,9 @@ class RecipeAdmin(admin.ModelAdmin):
                 'ingredients__name',
                 'amount', 'ingredients__measurement_unit')])
 
-    @admin.display(description='В избранном')
+    @admin.display(description='В избранном', ordering='favorites_count')
     def get_favorite_count(self, obj):
-        return obj.favorites.count()
+        return obj.favorites_count
 
 
 @admin.register(Favorite)
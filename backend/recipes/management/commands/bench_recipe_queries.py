@@ -0,0 +1,108 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from users.models import User
+from ...models import Favorite, IngredientInRecipe, Recipe, ShoppingCart
+
+# Индексы и ограничения из миграции 0010, без которых снимается
+# замер «до».
+INDEXES = {Recipe: ('recipe_author_pub_date_idx',)}
+CONSTRAINTS = {
+    Favorite: ('unique_favorite_user',),
+    ShoppingCart: ('unique_shopping_cart_user',),
+}
+
+
+class Command(BaseCommand):
+    """Планы и время горячих запросов рецептов до и после индексов"""
+    help = ('Показывает планы выполнения и время горячих запросов к '
+            'рецептам, избранному и спискам покупок. С --before '
+            'повторяет замер без составных индексов (PostgreSQL). '
+            'Данные заполняет generate_data.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument(
+            '--before', action='store_true',
+            help='Сначала замер без индексов в откатываемой транзакции.')
+
+    def queries(self, rnd, users, authors, recipes):
+        """Горячие запросы: (название, выборка по случайным id)."""
+        return (
+            ('Отметка избранного (user, recipe)',
+             lambda: Favorite.objects.filter(
+                 user_id=rnd.choice(users),
+                 recipe_id=rnd.choice(recipes))[:1]),
+            ('Отметка покупок (user, recipe)',
+             lambda: ShoppingCart.objects.filter(
+                 user_id=rnd.choice(users),
+                 recipe_id=rnd.choice(recipes))[:1]),
+            ('Фильтр favorite=1',
+             lambda: Recipe.objects.filter(
+                 favorite__user_id=rnd.choice(users),
+             ).order_by('-pub_date')[:6]),
+            ('Фильтр shopping_cart=1',
+             lambda: Recipe.objects.filter(
+                 shopping_cart__user_id=rnd.choice(users),
+             ).order_by('-pub_date')[:6]),
+            ('Последние рецепты автора',
+             lambda: Recipe.objects.filter(
+                 author_id=rnd.choice(authors),
+             ).order_by('-pub_date')[:6]),
+            ('Ингредиенты рецепта',
+             lambda: IngredientInRecipe.objects.filter(
+                 recipe_id=rnd.choice(recipes))),
+        )
+
+    def measure(self, title, options, users, authors, recipes):
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+        rnd = random.Random(options['seed'])
+        for name, query in self.queries(rnd, users, authors, recipes):
+            plan = query().explain()
+            started = time.perf_counter()
+            for _ in range(options['repeat']):
+                list(query())
+            elapsed = (time.perf_counter() - started) / options['repeat']
+            self.stdout.write(f'{name}: {elapsed * 1000:.3f} мс')
+            self.stdout.write(f'  {plan}'.replace('\n', '\n  '))
+
+    def drop_indexes(self):
+        with connection.schema_editor() as schema_editor:
+            for model, names in INDEXES.items():
+                for index in model._meta.indexes:
+                    if index.name in names:
+                        schema_editor.remove_index(model, index)
+            for model, names in CONSTRAINTS.items():
+                for constraint in model._meta.constraints:
+                    if constraint.name in names:
+                        schema_editor.remove_constraint(model, constraint)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def handle(self, *args, **options):
+        users = list(User.objects.values_list('id', flat=True))
+        authors = list(Recipe.objects.values_list(
+            'author_id', flat=True).distinct())
+        recipes = list(Recipe.objects.values_list('id', flat=True))
+        if not recipes:
+            raise CommandError('Нет рецептов: выполните generate_data.')
+        self.stdout.write(
+            f'Пользователей: {len(users)}, рецептов: {len(recipes)}, '
+            f'в избранном: {Favorite.objects.count()}, '
+            f'в списках покупок: {ShoppingCart.objects.count()}')
+        if options['before']:
+            if connection.vendor != 'postgresql':
+                raise CommandError(
+                    'Замер без индексов требует транзакционного DDL '
+                    '(PostgreSQL).')
+            with transaction.atomic():
+                self.drop_indexes()
+                self.measure('До: без составных индексов', options,
+                             users, authors, recipes)
+                transaction.set_rollback(True)
+        self.measure('После: с составными индексами', options,
+                     users, authors, recipes)
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...transfer import export_recipes
+
+
+class Command(BaseCommand):
+    """Выгрузка рецептов в NDJSON"""
+    help = ('Потоково выгружает рецепты с тегами, ингредиентами и путями '
+            'фото в NDJSON: одна строка — один рецепт.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-',
+                            help='Файл выгрузки, «-» — стандартный вывод.')
+        parser.add_argument('--hash', action='store_true',
+                            help='Добавить sha256 файлов фото.')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if options['batch_size'] <= 0:
+            raise CommandError('--batch-size должен быть больше 0')
+        lines = export_recipes(with_hashes=options['hash'],
+                               batch_size=options['batch_size'])
+        started = time.monotonic()
+        try:
+            if options['path'] == '-':
+                total = self.write(
+                    lines, lambda line: self.stdout.write(line, ending=''))
+            else:
+                with open(options['path'], 'w', encoding='utf-8') as file:
+                    total = self.write(lines, file.write)
+        except OSError as err:
+            raise CommandError(f'Ошибка выгрузки: {err}')
+        elapsed = time.monotonic() - started
+        self.stderr.write(self.style.SUCCESS(
+            f'Выгружено рецептов: {total}, '
+            f'{total / elapsed if elapsed else total:.0f} рецептов/с.'))
+
+    @staticmethod
+    def write(lines, write):
+        total = 0
+        for line in lines:
+            write(line)
+            total += 1
+        return total
@@ -0,0 +1,228 @@
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from faker import Faker
+
+from users.models import Subscribe, User
+from ...models import (Favorite, FeedEntry, Ingredient, IngredientInRecipe,
+                       Recipe, ShoppingCart, ShoppingCartIngredient, Tag)
+from ...signals import bulk_changed
+from ...transfer import bulk_create_recipes
+
+TEXTS_POOL_SIZE = 500
+MAX_RECIPE_INGREDIENTS = 30
+
+
+class Command(BaseCommand):
+    """Генерация синтетических данных для нагрузочного тестирования"""
+    help = ('Заполняет базу пользователями, рецептами, избранным, '
+            'списками покупок и подписками. Нужны загруженные '
+            'ингредиенты (load_data).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--tags', type=int, default=10)
+        parser.add_argument(
+            '--favorites', type=int, default=20,
+            help='Среднее число рецептов в избранном у пользователя.')
+        parser.add_argument(
+            '--cart', type=int, default=5,
+            help='Среднее число рецептов в списке покупок у пользователя.')
+        parser.add_argument(
+            '--subscriptions', type=int, default=10,
+            help='Среднее число подписок у пользователя.')
+        parser.add_argument('--days', type=int, default=365,
+                            help='Период дат публикации рецептов.')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--password', default='synthetic-password')
+
+    def handle(self, *args, **options):
+        self.rnd = random.Random(options['seed'])
+        self.fake = Faker('ru_RU')
+        self.fake.seed_instance(options['seed'])
+        self.batch_size = options['batch_size']
+        self.started = time.monotonic()
+        self.ingredient_ids = list(
+            Ingredient.objects.order_by('id').values_list('id', flat=True))
+        if not self.ingredient_ids:
+            raise CommandError('Нет ингредиентов: выполните load_data.')
+        self.ingredient_names = list(
+            Ingredient.objects.order_by('id').values_list('name', flat=True))
+
+        tag_ids = self.create_tags(options['tags'], options['seed'])
+        user_ids = self.create_users(
+            options['users'], options['seed'], options['password'])
+        if not user_ids:
+            raise CommandError('Нет пользователей для рецептов.')
+        recipe_ids = self.create_recipes(
+            options['recipes'], user_ids, tag_ids, options['days'])
+        if recipe_ids:
+            self.create_marks(Favorite, user_ids, recipe_ids,
+                              options['favorites'])
+            self.create_marks(ShoppingCart, user_ids, recipe_ids,
+                              options['cart'])
+            Recipe.objects.recount_favorites()
+        self.create_subscriptions(user_ids, options['subscriptions'])
+        self.rebuild_derived()
+        for model in (Tag, User, Recipe, IngredientInRecipe):
+            bulk_changed.send(sender=model)
+        self.log('Готово')
+
+    def log(self, message):
+        self.stdout.write(
+            f'[{time.monotonic() - self.started:7.1f} с] {message}')
+
+    def rebuild_derived(self):
+        """Пересчёт таблиц, которые bulk_create обходит без сигналов."""
+        ShoppingCartIngredient.objects.rebuild(batch_size=self.batch_size)
+        self.log(f'Сумм ингредиентов в списках покупок: '
+                 f'{ShoppingCartIngredient.objects.count()}')
+        cache.delete(FeedEntry.objects.pull_authors_key)
+        FeedEntry.objects.rebuild(batch_size=self.batch_size)
+        self.log(f'Записей в лентах: {FeedEntry.objects.count()}')
+        call_command('rank_trending', stdout=self.stdout)
+
+    def count(self, mean):
+        """Случайное количество со средним mean и длинным хвостом."""
+        if mean <= 0:
+            return 0
+        return int(self.rnd.expovariate(1 / mean))
+
+    def popular(self, items):
+        """Элемент с перекосом в сторону начала списка, как у популярных."""
+        return items[int(len(items) * self.rnd.random() ** 3)]
+
+    def bulk_create(self, model, objects, **kwargs):
+        model.objects.bulk_create(
+            objects, batch_size=self.batch_size, **kwargs)
+
+    def create_tags(self, amount, seed):
+        tags = [
+            Tag(name=f'Тег {seed}-{number}',
+                color=f'#{(seed * 7919 + number) % 0xFFFFFF:06X}',
+                slug=f'synthetic-{seed}-{number}')
+            for number in range(amount)
+        ]
+        self.bulk_create(Tag, tags, ignore_conflicts=True)
+        tag_ids = list(Tag.objects.values_list('id', flat=True))
+        self.log(f'Тегов: {len(tag_ids)}')
+        return tag_ids
+
+    def create_users(self, amount, seed, password):
+        password = make_password(password)
+        prefix = f'synthetic{seed}_'
+        for start in range(0, amount, self.batch_size):
+            users = []
+            for number in range(start, min(start + self.batch_size, amount)):
+                users.append(User(
+                    username=f'{prefix}{number}',
+                    email=f'{prefix}{number}@example.com',
+                    first_name=self.fake.first_name(),
+                    last_name=self.fake.last_name(),
+                    password=password,
+                ))
+            self.bulk_create(User, users, ignore_conflicts=True)
+        user_ids = list(User.objects.filter(
+            username__startswith=prefix).values_list('id', flat=True))
+        self.log(f'Пользователей: {len(user_ids)}')
+        return user_ids
+
+    def create_recipes(self, amount, user_ids, tag_ids, days):
+        texts = [self.fake.paragraph(nb_sentences=5)
+                 for _ in range(TEXTS_POOL_SIZE)]
+        authors = user_ids[:max(1, len(user_ids) // 5)]
+        now = timezone.now()
+        period = timedelta(days=days).total_seconds()
+        recipe_ids = []
+        ingredients_total = 0
+        for start in range(0, amount, self.batch_size):
+            size = min(self.batch_size, amount - start)
+            recipes = [
+                Recipe(
+                    name=(f'{self.rnd.choice(self.ingredient_names)} '
+                          f'с {self.rnd.choice(self.ingredient_names)}'
+                          ).capitalize()[:200],
+                    author_id=self.popular(authors),
+                    image='recipes/synthetic.png',
+                    text=self.rnd.choice(texts),
+                    cooking_time=self.rnd.randint(5, 180),
+                    pub_date=now - timedelta(
+                        seconds=self.rnd.random() * period),
+                )
+                for _ in range(size)
+            ]
+            with transaction.atomic():
+                batch_ids = [recipe.pk for recipe in bulk_create_recipes(
+                    recipes, self.batch_size)]
+                Recipe.objects.filter(id__range=(
+                    min(batch_ids), max(batch_ids))).update_search_vector()
+                ingredients = []
+                tags = []
+                for recipe_id in batch_ids:
+                    amount_ingredients = min(
+                        MAX_RECIPE_INGREDIENTS,
+                        max(1, int(self.rnd.lognormvariate(2, 0.5))),
+                        len(self.ingredient_ids))
+                    ingredients.extend(
+                        IngredientInRecipe(
+                            recipe_id=recipe_id, ingredients_id=ingredient_id,
+                            amount=self.rnd.randint(1, 500))
+                        for ingredient_id in self.rnd.sample(
+                            self.ingredient_ids, amount_ingredients)
+                    )
+                    tags.extend(
+                        Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+                        for tag_id in self.rnd.sample(
+                            tag_ids, min(len(tag_ids),
+                                         self.rnd.randint(1, 3)))
+                    )
+                self.bulk_create(IngredientInRecipe, ingredients)
+                self.bulk_create(Recipe.tags.through, tags)
+            recipe_ids.extend(batch_ids)
+            ingredients_total += len(ingredients)
+            self.log(f'Рецептов: {len(recipe_ids)}, '
+                     f'ингредиентов в рецептах: {ingredients_total}')
+        return recipe_ids
+
+    def create_marks(self, model, user_ids, recipe_ids, mean):
+        total = 0
+        marks = []
+        for user_id in user_ids:
+            chosen = {self.popular(recipe_ids)
+                      for _ in range(self.count(mean))}
+            marks.extend(model(user_id=user_id, recipe_id=recipe_id)
+                         for recipe_id in chosen)
+            if len(marks) >= self.batch_size:
+                self.bulk_create(model, marks, ignore_conflicts=True)
+                total += len(marks)
+                marks = []
+        self.bulk_create(model, marks, ignore_conflicts=True)
+        total += len(marks)
+        self.log(f'{model._meta.verbose_name_plural}: {total}')
+
+    def create_subscriptions(self, user_ids, mean):
+        total = 0
+        subscriptions = []
+        authors = user_ids[:max(1, len(user_ids) // 5)]
+        for user_id in user_ids:
+            chosen = {self.popular(authors) for _ in range(self.count(mean))}
+            chosen.discard(user_id)
+            subscriptions.extend(Subscribe(user_id=user_id, author_id=author)
+                                 for author in chosen)
+            if len(subscriptions) >= self.batch_size:
+                self.bulk_create(Subscribe, subscriptions,
+                                 ignore_conflicts=True)
+                total += len(subscriptions)
+                subscriptions = []
+        self.bulk_create(Subscribe, subscriptions, ignore_conflicts=True)
+        total += len(subscriptions)
+        self.log(f'Подписок: {total}')
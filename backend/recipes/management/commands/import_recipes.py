@@ -0,0 +1,51 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...transfer import RecipeImporter, TransferError
+
+
+class Command(BaseCommand):
+    """Загрузка рецептов из NDJSON"""
+    help = ('Потоково загружает рецепты из NDJSON, который создаёт '
+            'export_recipes, пакетами в отдельных транзакциях. Уже '
+            'загруженные рецепты пропускаются, поэтому после сбоя '
+            'загрузку можно повторить.')
+    stealth_options = ('stdin',)
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-',
+                            help='Файл рецептов, «-» — стандартный ввод.')
+        parser.add_argument(
+            '--images',
+            help='Каталог с фото исходного хранилища; недостающие фото '
+                 'копируются из него.')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--skip', type=int, default=0,
+                            help='Пропустить первые строки файла.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] <= 0:
+            raise CommandError('--batch-size должен быть больше 0')
+        importer = RecipeImporter(images_dir=options['images'],
+                                  batch_size=options['batch_size'])
+        try:
+            if options['path'] == '-':
+                importer.run(options.get('stdin', sys.stdin),
+                             options['skip'], self.progress)
+            else:
+                with open(options['path'], encoding='utf-8') as file:
+                    importer.run(file, options['skip'], self.progress)
+        except (OSError, TransferError) as err:
+            raise CommandError(
+                f'Ошибка загрузки: {err}. Загружены строки до '
+                f'{importer.line}, продолжить: --skip {importer.line}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Загрузка завершена: строк {importer.line}, добавлено '
+            f'{importer.created}, пропущено {importer.skipped} за '
+            f'{importer.elapsed:.1f} с, {importer.rate:.0f} строк/с.'))
+
+    def progress(self, importer):
+        self.stdout.write(
+            f'Обработано {importer.line} строк, добавлено '
+            f'{importer.created}, {importer.rate:.0f} строк/с')
@@ -1,22 +1,164 @@
 import csv
+import json
+import os
+import time
+from itertools import islice
 
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
 
 from ...models import Ingredient
+from ...signals import bulk_changed
+
+FORMATS = {'.csv': 'csv', '.json': 'json', '.jsonl': 'jsonl',
+           '.ndjson': 'jsonl'}
+CHUNK_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    """Строки CSV: name,measurement_unit или id,name,measurement_unit."""
+    for row in csv.reader(file):
+        if not row:
+            continue
+        if len(row) == 3:
+            yield {'id': int(row[0]), 'name': row[1],
+                   'measurement_unit': row[2]}
+        else:
+            name, measurement_unit = row
+            yield {'name': name, 'measurement_unit': measurement_unit}
+
+
+def read_jsonl(file):
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+def read_json(file):
+    """Объекты JSON-массива по одному, без чтения файла целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    while True:
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if not started and position < len(buffer):
+                if buffer[position] != '[':
+                    raise ValueError('Ожидался JSON-массив')
+                started = True
+                position += 1
+                continue
+            if position < len(buffer) and buffer[position] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except ValueError:
+                break
+            yield item
+        chunk = file.read(CHUNK_SIZE)
+        if not chunk:
+            raise ValueError('Неожиданный конец JSON-массива')
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+READERS = {'csv': read_csv, 'json': read_json, 'jsonl': read_jsonl}
 
 
 class Command(BaseCommand):
     """Выгрузка первоначальных данных в DB-проекта"""
+    help = ('Потоковый импорт ингредиентов из CSV, JSON или JSON Lines '
+            'пакетами через bulk_create.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?',
+            default=os.path.join(settings.BASE_DIR, 'data', 'ingredients.csv'))
+        parser.add_argument('--format', choices=READERS)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--update', action='store_true',
+            help='Обновить name и measurement_unit строк с указанным id.')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Выполнить импорт и откатить транзакцию.')
+
     def handle(self, *args, **options):
+        path = options['path']
+        data_format = options['format'] or FORMATS.get(
+            os.path.splitext(path)[1].lower())
+        if data_format is None:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        if options['batch_size'] <= 0:
+            raise CommandError('--batch-size должен быть больше 0')
         try:
-            with open('data/ingredients.csv',
-                      encoding='utf-8') as file:
-                file_reader = csv.reader(file)
-                for ingredient in file_reader:
-                    name, measurement_unit = ingredient
-                    Ingredient.objects.get_or_create(
-                        name=name,
-                        measurement_unit=measurement_unit)
-            print('Импорт данных произведён успешно')
-        except IOError as err:
-            print(f'Ошибка импорта: {err}')
+            with open(path, encoding='utf-8') as file, transaction.atomic():
+                before = Ingredient.objects.count()
+                read, updated = self.load(
+                    READERS[data_format](file), options)
+                created = Ingredient.objects.count() - before
+                if options['dry_run']:
+                    transaction.set_rollback(True)
+        except (OSError, ValueError, KeyError) as err:
+            raise CommandError(f'Ошибка импорта: {err}')
+        if not options['dry_run'] and (created or updated):
+            bulk_changed.send(sender=Ingredient)
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Пробный импорт" if options["dry_run"] else "Импорт"} '
+            f'завершён: прочитано {read}, добавлено {created}, '
+            f'обновлено {updated}, пропущено {read - created - updated}.'))
+
+    def load(self, rows, options):
+        started = time.monotonic()
+        read = updated = 0
+        with_ids = False
+        while True:
+            batch = [
+                Ingredient(id=row.get('id'), name=row['name'].strip(),
+                           measurement_unit=row['measurement_unit'].strip())
+                for row in islice(rows, options['batch_size'])
+            ]
+            if not batch:
+                break
+            read += len(batch)
+            if options['update']:
+                updated += self.update(batch)
+            else:
+                for ingredient in batch:
+                    ingredient.id = None
+            with_ids = with_ids or any(item.id for item in batch)
+            Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f'Обработано {read} строк, '
+                f'{read / elapsed if elapsed else read:.0f} строк/с')
+        if with_ids:
+            self.reset_sequence()
+        return read, updated
+
+    @staticmethod
+    def update(batch):
+        """Обновляет существующие строки пакета и убирает их из пакета."""
+        existing = Ingredient.objects.in_bulk(
+            [item.id for item in batch if item.id])
+        changed = [
+            item for item in batch
+            if item.id in existing
+            and (existing[item.id].name, existing[item.id].measurement_unit)
+            != (item.name, item.measurement_unit)
+        ]
+        Ingredient.objects.bulk_update(changed, ('name', 'measurement_unit'))
+        batch[:] = [item for item in batch if item.id not in existing]
+        return len(changed)
+
+    @staticmethod
+    def reset_sequence():
+        """Сдвиг счётчика id после вставки строк с явными id."""
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(
+                    no_style(), [Ingredient]):
+                cursor.execute(sql)
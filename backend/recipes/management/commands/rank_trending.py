@@ -0,0 +1,46 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from ...models import Favorite, ShoppingCart, TrendingRecipe
+
+
+class Command(BaseCommand):
+    """Расчёт рейтинга популярных рецептов"""
+    help = ('Пересчитывает рейтинг популярных рецептов по недавним '
+            'добавлениям в избранное и список покупок с затуханием '
+            'по времени. Рассчитан на запуск по расписанию.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--window', type=float, default=settings.TRENDING_WINDOW_HOURS,
+            help='Учитываемый период, часов.')
+        parser.add_argument(
+            '--half-life', type=float,
+            default=settings.TRENDING_HALF_LIFE_HOURS,
+            help='Через сколько часов вес отметки падает вдвое.')
+        parser.add_argument(
+            '--bucket', type=float, default=1,
+            help='Шаг дискретизации затухания, часов.')
+
+    def handle(self, *args, **options):
+        if min(options['window'], options['half_life'],
+               options['bucket']) <= 0:
+            raise CommandError('Периоды должны быть положительными.')
+        started = time.monotonic()
+        total = TrendingRecipe.objects.rebuild(
+            now=timezone.now(),
+            window=timedelta(hours=options['window']),
+            half_life=timedelta(hours=options['half_life']),
+            bucket=timedelta(hours=options['bucket']),
+            weights={
+                Favorite: settings.TRENDING_FAVORITE_WEIGHT,
+                ShoppingCart: settings.TRENDING_SHOPPING_CART_WEIGHT,
+            },
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Рецептов в рейтинге: {total} '
+            f'({time.monotonic() - started:.1f} с).'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ...models import FeedEntry
+
+
+class Command(BaseCommand):
+    """Пересборка лент подписок"""
+    help = ('Пересобирает ленты подписок, например после загрузки '
+            'данных в обход сохранения моделей.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append',
+                            help='id пользователя; можно указать несколько.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            FeedEntry.objects.rebuild(
+                users=options['user'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Ленты пересобраны: {FeedEntry.objects.count()} записей.'))
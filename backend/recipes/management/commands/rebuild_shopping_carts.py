@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ...models import ShoppingCartIngredient
+
+
+class Command(BaseCommand):
+    """Пересчёт сумм ингредиентов в списках покупок"""
+    help = 'Пересобирает таблицу сумм ингредиентов из списков покупок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append',
+                            help='id пользователя; можно указать несколько.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            ShoppingCartIngredient.objects.rebuild(
+                users=options['user'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Списки покупок пересчитаны: '
+            f'{ShoppingCartIngredient.objects.count()} строк.'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from ...models import Recipe
+
+
+class Command(BaseCommand):
+    """Сверка счётчиков избранного с таблицей избранного"""
+    help = ('Исправляет favorites_count у рецептов, где он разошёлся '
+            'с числом записей в избранном.')
+
+    def handle(self, *args, **options):
+        fixed = Recipe.objects.recount_favorites()
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено рецептов: {fixed}.'))
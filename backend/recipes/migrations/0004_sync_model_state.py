@@ -0,0 +1,102 @@
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """Приведение миграций в соответствие с моделями.
+
+    Модели переименовывались без миграций: ShoppingList стал
+    ShoppingCart, поле ingredient у IngredientInRecipe — ingredients.
+    Переименования сохраняют данные.
+    """
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0003_ingredient_name_trigram_index'),
+    ]
+
+    operations = [
+        migrations.RenameModel('ShoppingList', 'ShoppingCart'),
+        migrations.AlterModelOptions(
+            name='shoppingcart',
+            options={'ordering': ('-id',), 'verbose_name': 'Список покупок', 'verbose_name_plural': 'Списки покупок'},
+        ),
+        migrations.AlterField(
+            model_name='shoppingcart',
+            name='recipe',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_cart', to='recipes.recipe', verbose_name='Рецепт'),
+        ),
+        migrations.AlterField(
+            model_name='shoppingcart',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_cart', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+        ),
+        migrations.AlterModelOptions(
+            name='favorite',
+            options={'ordering': ('-id',), 'verbose_name': 'Избранный рецепт', 'verbose_name_plural': 'Избранные рецепты'},
+        ),
+        migrations.AlterField(
+            model_name='favorite',
+            name='recipe',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='favorite', to='recipes.recipe', verbose_name='Рецепт'),
+        ),
+        migrations.AlterField(
+            model_name='favorite',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='favorite', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+        ),
+        migrations.RemoveConstraint(
+            model_name='ingredientinrecipe',
+            name='unique_recipe_and_ingredient',
+        ),
+        migrations.RenameField(
+            model_name='ingredientinrecipe',
+            old_name='ingredient',
+            new_name='ingredients',
+        ),
+        migrations.AlterField(
+            model_name='ingredientinrecipe',
+            name='ingredients',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='amount_ingredient', to='recipes.ingredient', verbose_name='Ингредиент'),
+        ),
+        migrations.AddConstraint(
+            model_name='ingredientinrecipe',
+            constraint=models.UniqueConstraint(fields=('recipe', 'ingredients'), name='unique_recipe_and_ingredient'),
+        ),
+        migrations.AlterField(
+            model_name='ingredientinrecipe',
+            name='amount',
+            field=models.PositiveIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1, message='Минимальное количество ингредиентов`1` !'), django.core.validators.MaxValueValidator(10000, message='Максимальное количество ингредиентов`10000` !')], verbose_name='Количество'),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='cooking_time',
+            field=models.PositiveIntegerField(validators=[django.core.validators.MinValueValidator(1, message='Минимальное время приготовления: 1 минута!'), django.core.validators.MaxValueValidator(1441, message='Максимальное время приготовления: 1441 минут!')], verbose_name='Время приготовления в минутах'),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(upload_to='', verbose_name='Фото блюда'),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='ingredients',
+            field=models.ManyToManyField(related_name='recipes', through='recipes.IngredientInRecipe', to='recipes.Ingredient'),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='tags',
+            field=models.ManyToManyField(related_name='recipes', to='recipes.Tag', verbose_name='Тег'),
+        ),
+        migrations.AlterField(
+            model_name='tag',
+            name='slug',
+            field=models.SlugField(max_length=200, unique=True, validators=[django.core.validators.RegexValidator(message='Введено некорректное значение поля name', regex='^[-a-zA-Z0-9_]+$')], verbose_name='Slug'),
+        ),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient_measurement_unit'),
+        ),
+    ]
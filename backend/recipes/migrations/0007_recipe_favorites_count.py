@@ -0,0 +1,33 @@
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def count_favorites(apps, schema_editor):
+    Favorite = apps.get_model('recipes', 'Favorite')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Recipe.objects.update(favorites_count=Coalesce(models.Subquery(
+        Favorite.objects.filter(
+            recipe=models.OuterRef('pk'),
+        ).order_by().values('recipe').annotate(
+            total=models.Count('id'),
+        ).values('total')), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_feedentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.RunPython(count_favorites, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count', '-id'], name='recipe_favorites_count_idx'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def duplicates(model):
+    """Повторные отметки (user, recipe), кроме самой ранней."""
+    return model.objects.exclude(id__in=model.objects.values(
+        'user', 'recipe',
+    ).annotate(keep=models.Min('id')).order_by().values('keep'))
+
+
+def dedupe_favorites(apps, schema_editor):
+    Favorite = apps.get_model('recipes', 'Favorite')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    recipes = set(duplicates(Favorite).values_list('recipe', flat=True))
+    if not recipes:
+        return
+    duplicates(Favorite).delete()
+    Recipe.objects.filter(id__in=recipes).update(
+        favorites_count=Coalesce(models.Subquery(Favorite.objects.filter(
+            recipe=models.OuterRef('pk'),
+        ).order_by().values('recipe').annotate(
+            total=models.Count('id'),
+        ).values('total')), 0))
+
+
+def dedupe_shopping_carts(apps, schema_editor):
+    ShoppingCart = apps.get_model('recipes', 'ShoppingCart')
+    ShoppingCartIngredient = apps.get_model(
+        'recipes', 'ShoppingCartIngredient')
+    IngredientInRecipe = apps.get_model('recipes', 'IngredientInRecipe')
+    users = set(duplicates(ShoppingCart).values_list('user', flat=True))
+    if not users:
+        return
+    duplicates(ShoppingCart).delete()
+    # Суммы ингредиентов считались с повторами, пересчитываем их.
+    ShoppingCartIngredient.objects.filter(user__in=users).delete()
+    ShoppingCartIngredient.objects.bulk_create(
+        ShoppingCartIngredient(user_id=user_id, ingredient_id=ingredient_id,
+                               amount=amount)
+        for user_id, ingredient_id, amount in IngredientInRecipe.objects.filter(
+            recipe__shopping_cart__user__in=users,
+            ingredients__isnull=False,
+        ).values(
+            'recipe__shopping_cart__user', 'ingredients',
+        ).annotate(total=models.Sum('amount')).order_by().values_list(
+            'recipe__shopping_cart__user', 'ingredients', 'total',
+        ).iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_trendingrecipe'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_favorites, migrations.RunPython.noop),
+        migrations.RunPython(dedupe_shopping_carts,
+                             migrations.RunPython.noop),
+    ]
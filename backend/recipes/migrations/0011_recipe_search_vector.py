@@ -0,0 +1,38 @@
+import django.contrib.postgres.search
+from django.db import migrations
+
+INDEX_NAME = 'recipes_recipe_search_vector_gin'
+
+
+def create_search_index(apps, schema_editor):
+    """GIN-индекс и заполнение поискового вектора в PostgreSQL."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        "UPDATE recipes_recipe SET search_vector = "
+        "setweight(to_tsvector('russian', COALESCE(name, '')), 'A') || "
+        "setweight(to_tsvector('russian', COALESCE(text, '')), 'B')")
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON recipes_recipe '
+        f'USING gin (search_vector)')
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_marks_unique_and_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
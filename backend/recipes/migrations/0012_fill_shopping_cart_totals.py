@@ -0,0 +1,39 @@
+from django.db import migrations, models
+
+
+def fill_shopping_cart_totals(apps, schema_editor):
+    """Суммы ингредиентов для списков покупок, собранных до 0005.
+
+    Таблица сумм создаётся пустой, а скачивание списка покупок читает
+    только её, поэтому суммы пересчитываются из списков покупок так
+    же, как в ShoppingCartIngredient.objects.rebuild().
+    """
+    ShoppingCartIngredient = apps.get_model(
+        'recipes', 'ShoppingCartIngredient')
+    IngredientInRecipe = apps.get_model('recipes', 'IngredientInRecipe')
+    ShoppingCartIngredient.objects.all().delete()
+    ShoppingCartIngredient.objects.bulk_create(
+        (ShoppingCartIngredient(user_id=user_id,
+                                ingredient_id=ingredient_id, amount=amount)
+         for user_id, ingredient_id, amount in IngredientInRecipe.objects.filter(
+             recipe__shopping_cart__user__isnull=False,
+             ingredients__isnull=False,
+         ).values(
+             'recipe__shopping_cart__user', 'ingredients',
+         ).annotate(total=models.Sum('amount')).order_by().values_list(
+             'recipe__shopping_cart__user', 'ingredients', 'total',
+         ).iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_shopping_cart_totals,
+                             migrations.RunPython.noop),
+    ]
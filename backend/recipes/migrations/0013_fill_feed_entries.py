@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_feed_entries(apps, schema_editor):
+    """Ленты подписок, оформленных до 0006.
+
+    Таблица лент создаётся пустой, поэтому у существующих подписчиков
+    лента была бы пуста до запуска rebuild_feeds. Ленты собираются так
+    же, как в FeedEntry.objects.rebuild(): последние
+    FEED_BACKFILL_SIZE рецептов каждого автора, кроме авторов, чьи
+    рецепты читаются напрямую.
+    """
+    FeedEntry = apps.get_model('recipes', 'FeedEntry')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Subscribe = apps.get_model('users', 'Subscribe')
+    pull_authors = Subscribe.objects.values('author').annotate(
+        followers=models.Count('id'),
+    ).filter(
+        followers__gt=settings.FEED_FANOUT_MAX_FOLLOWERS,
+    ).order_by().values('author')
+    latest = Recipe.objects.filter(
+        author=models.OuterRef('author'),
+    ).order_by('-pub_date', '-id').values('id')[
+        :settings.FEED_BACKFILL_SIZE]
+    FeedEntry.objects.all().delete()
+    FeedEntry.objects.bulk_create(
+        (FeedEntry(user_id=user_id, author_id=author_id,
+                   recipe_id=recipe_id, pub_date=pub_date)
+         for user_id, author_id, recipe_id, pub_date in Subscribe.objects.exclude(
+             author__in=pull_authors,
+         ).filter(
+             author__recipes__in=latest,
+         ).values_list(
+             'user_id', 'author_id', 'author__recipes__id',
+             'author__recipes__pub_date',
+         ).order_by().iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_sync_model_state'),
+        ('recipes', '0012_fill_shopping_cart_totals'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_feed_entries, migrations.RunPython.noop),
+    ]
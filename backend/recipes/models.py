@@ -1,10 +1,20 @@
+from collections import defaultdict
+
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core import validators
-from django.db import models
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.core.cache import cache
+from django.db import connection, models, transaction
+from django.db.models.functions import Coalesce, Greatest
+
+from users.models import Subscribe
 
 User = get_user_model()
 
+# Конфигурация полнотекстового поиска PostgreSQL
+SEARCH_CONFIG = 'russian'
+
 
 class Ingredient(models.Model):
     """Модель Ингредиент"""
@@ -60,6 +70,55 @@ class Tag(models.Model):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+    """Выборки рецептов."""
+
+    def with_related(self):
+        """Автор, теги и ингредиенты для вывода рецептов."""
+        return self.select_related('author').defer(
+            'search_vector',
+        ).prefetch_related(
+            'tags',
+            models.Prefetch(
+                'recipe_ingredients',
+                queryset=IngredientInRecipe.objects.select_related(
+                    'ingredients')),
+        )
+
+    def update_search_vector(self):
+        """Пересчёт поискового вектора по названию и описанию.
+
+        Поле используется только в PostgreSQL, в других базах
+        ничего не делает.
+        """
+        if connection.vendor != 'postgresql':
+            return 0
+        return self.update(search_vector=(
+            SearchVector('name', weight='A', config=SEARCH_CONFIG)
+            + SearchVector('text', weight='B', config=SEARCH_CONFIG)))
+
+    def change_favorites_count(self, delta):
+        """Атомарное изменение счётчика избранного на delta."""
+        return self.update(favorites_count=Greatest(
+            models.F('favorites_count') + delta, 0))
+
+    def recount_favorites(self):
+        """Пересчёт счётчика избранного там, где он разошёлся с данными.
+
+        Возвращает число исправленных рецептов.
+        """
+        actual = Coalesce(models.Subquery(Favorite.objects.filter(
+            recipe=models.OuterRef('pk'),
+        ).order_by().values('recipe').annotate(
+            total=models.Count('id'),
+        ).values('total')), 0)
+        drifted = self.annotate(actual=actual).exclude(
+            favorites_count=models.F('actual'))
+        return self.model.objects.filter(
+            pk__in=drifted.values('pk'),
+        ).update(favorites_count=actual)
+
+
 class Recipe(models.Model):
     """Модель Рецепт"""
     name = models.CharField(
@@ -97,11 +156,25 @@ class Recipe(models.Model):
     )
     pub_date = models.DateTimeField('Дата публикации',
                                     auto_now_add=True)
+    favorites_count = models.PositiveIntegerField(
+        'В избранном', default=0, editable=False)
+    search_vector = SearchVectorField(
+        'Поисковый вектор', null=True, editable=False)
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='recipe_pub_date_id_idx'),
+            models.Index(fields=['-favorites_count', '-id'],
+                         name='recipe_favorites_count_idx'),
+            models.Index(fields=['author', '-pub_date'],
+                         name='recipe_author_pub_date_idx'),
+        ]
 
     def __str__(self):
         return f'{self.author.username}, {self.name}'
@@ -162,14 +235,20 @@ class Favorite(models.Model):
                                on_delete=models.CASCADE,
                                verbose_name='Рецепт',
                                related_name='favorite')
-    constraints = (models.UniqueConstraint(
-        fields=['recipe', 'user'],
-        name='unique_favorite_user'))
+    created = models.DateTimeField('Дата добавления',
+                                   auto_now_add=True,
+                                   null=True,
+                                   db_index=True)
 
     class Meta:
         verbose_name = 'Избранный рецепт'
         verbose_name_plural = 'Избранные рецепты'
         ordering = ('-id',)
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_favorite_user'),
+        ]
 
     def __str__(self):
         return (f'Пользователь {self.user.username} '
@@ -186,15 +265,347 @@ class ShoppingCart(models.Model):
                                on_delete=models.CASCADE,
                                verbose_name='Рецепт',
                                related_name='shopping_cart')
-    constraints = (models.UniqueConstraint(
-        fields=['recipe', 'user'],
-        name='unique_shopping_cart_user'))
+    created = models.DateTimeField('Дата добавления',
+                                   auto_now_add=True,
+                                   null=True,
+                                   db_index=True)
 
     class Meta:
         verbose_name = 'Список покупок'
         verbose_name_plural = 'Списки покупок'
         ordering = ('-id',)
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_shopping_cart_user'),
+        ]
 
     def __str__(self):
         return (f'Пользователь {self.user} '
                 f'добавил {self.recipe.name} в покупки.')
+
+
+class ShoppingCartIngredientManager(models.Manager):
+    """Поддержка сумм ингредиентов в списках покупок."""
+
+    def _change_recipe(self, user, recipe, sign):
+        amounts = dict(IngredientInRecipe.objects.filter(
+            recipe=recipe, ingredients__isnull=False,
+        ).values_list('ingredients_id', 'amount'))
+        if not amounts:
+            return
+        # Блокировка пользователя упорядочивает параллельные изменения
+        # одного списка покупок.
+        list(User.objects.select_for_update().filter(
+            pk=user.pk).values_list('pk'))
+        totals = self.filter(user=user, ingredient_id__in=amounts)
+        existing = set(totals.values_list('ingredient_id', flat=True))
+        if existing:
+            totals.update(amount=Greatest(
+                models.F('amount') + models.Case(
+                    *(models.When(ingredient_id=pk,
+                                  then=sign * amounts[pk])
+                      for pk in existing),
+                    output_field=models.IntegerField()),
+                0))
+        if sign > 0:
+            self.bulk_create(
+                self.model(user=user, ingredient_id=pk, amount=amount)
+                for pk, amount in amounts.items() if pk not in existing)
+        else:
+            totals.filter(amount=0).delete()
+
+    def add_recipe(self, user, recipe):
+        """Прибавить ингредиенты рецепта к списку покупок."""
+        self._change_recipe(user, recipe, 1)
+
+    def remove_recipe(self, user, recipe):
+        """Вычесть ингредиенты рецепта из списка покупок."""
+        self._change_recipe(user, recipe, -1)
+
+    def rebuild(self, users=None, ingredients=None, batch_size=1000):
+        """Пересчёт сумм из списков покупок.
+
+        users и ingredients ограничивают пересчёт; без них
+        пересчитываются все списки покупок.
+        """
+        # Условия на список покупок задаются одним filter(), чтобы
+        # соединение с ним не повторялось и суммы не удваивались.
+        source = {'recipe__shopping_cart__user__isnull': False,
+                  'ingredients__isnull': False}
+        totals = self.all()
+        if users is not None:
+            source['recipe__shopping_cart__user__in'] = users
+            totals = totals.filter(user__in=users)
+        if ingredients is not None:
+            source['ingredients__in'] = ingredients
+            totals = totals.filter(ingredient__in=ingredients)
+        totals.delete()
+        rows = IngredientInRecipe.objects.filter(**source).values(
+            'recipe__shopping_cart__user', 'ingredients',
+        ).annotate(total=models.Sum('amount')).order_by().values_list(
+            'recipe__shopping_cart__user', 'ingredients', 'total',
+        ).iterator()
+        self.bulk_create(
+            (self.model(user_id=user_id, ingredient_id=ingredient_id,
+                        amount=amount)
+             for user_id, ingredient_id, amount in rows),
+            batch_size=batch_size)
+
+
+class ShoppingCartIngredient(models.Model):
+    """Модель суммы ингредиента в списке покупок пользователя"""
+    user = models.ForeignKey(User,
+                             on_delete=models.CASCADE,
+                             verbose_name='Пользователь',
+                             related_name='shopping_cart_ingredients')
+    ingredient = models.ForeignKey(Ingredient,
+                                   on_delete=models.CASCADE,
+                                   verbose_name='Ингредиент',
+                                   related_name='shopping_cart_totals')
+    amount = models.PositiveIntegerField('Количество')
+
+    objects = ShoppingCartIngredientManager()
+
+    class Meta:
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Ингредиенты в списках покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_cart_ingredient'),
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.amount} {self.ingredient}'
+
+
+class FeedEntryManager(models.Manager):
+    """Лента подписок: рассылка рецептов подписчикам при записи."""
+    pull_authors_key = 'feed:pull_authors'
+
+    def pull_authors(self):
+        """id авторов, чьи рецепты не рассылаются, а читаются напрямую.
+
+        Это авторы с числом подписчиков больше
+        FEED_FANOUT_MAX_FOLLOWERS; множество пересчитывается раз
+        в FEED_PULL_AUTHORS_TIMEOUT секунд.
+        """
+        authors = cache.get(self.pull_authors_key)
+        if authors is None:
+            authors = frozenset(Subscribe.objects.values(
+                'author',
+            ).annotate(
+                followers=models.Count('id'),
+            ).filter(
+                followers__gt=settings.FEED_FANOUT_MAX_FOLLOWERS,
+            ).order_by().values_list('author', flat=True))
+            cache.set(self.pull_authors_key, authors,
+                      settings.FEED_PULL_AUTHORS_TIMEOUT)
+        return authors
+
+    def fan_out(self, recipe, batch_size=1000):
+        """Добавить новый рецепт в ленты подписчиков автора."""
+        self.fan_out_many([recipe], batch_size)
+
+    def fan_out_many(self, recipes, batch_size=1000):
+        """Добавить новые рецепты в ленты подписчиков их авторов."""
+        pull_authors = self.pull_authors()
+        by_author = defaultdict(list)
+        for recipe in recipes:
+            if recipe.author_id not in pull_authors:
+                by_author[recipe.author_id].append(recipe)
+        if not by_author:
+            return
+        followers = Subscribe.objects.filter(
+            author_id__in=by_author,
+        ).values_list('user_id', 'author_id').iterator()
+        self.bulk_create(
+            (self.model(user_id=user_id, recipe_id=recipe.pk,
+                        author_id=author_id, pub_date=recipe.pub_date)
+             for user_id, author_id in followers
+             for recipe in by_author[author_id]),
+            batch_size=batch_size, ignore_conflicts=True)
+
+    def backfill(self, user, author):
+        """Последние рецепты автора в ленту нового подписчика."""
+        if author.pk in self.pull_authors():
+            return
+        recipes = Recipe.objects.filter(author=author).order_by(
+            '-pub_date', '-id',
+        ).values_list('id', 'pub_date')[:settings.FEED_BACKFILL_SIZE]
+        self.bulk_create(
+            (self.model(user_id=user.pk, recipe_id=recipe_id,
+                        author_id=author.pk, pub_date=pub_date)
+             for recipe_id, pub_date in recipes),
+            ignore_conflicts=True)
+
+    def trim(self, user, author):
+        """Убрать рецепты автора из ленты отписавшегося."""
+        self.filter(user=user, author=author).delete()
+
+    def rebuild(self, users=None, batch_size=1000):
+        """Пересборка лент по подпискам.
+
+        В ленту попадают последние FEED_BACKFILL_SIZE рецептов
+        каждого автора, как при подписке.
+        """
+        entries = self.all()
+        subscriptions = Subscribe.objects.exclude(
+            author__in=self.pull_authors())
+        if users is not None:
+            entries = entries.filter(user__in=users)
+            subscriptions = subscriptions.filter(user__in=users)
+        entries.delete()
+        latest = Recipe.objects.filter(
+            author=models.OuterRef('author'),
+        ).order_by('-pub_date', '-id').values('id')[
+            :settings.FEED_BACKFILL_SIZE]
+        rows = subscriptions.filter(
+            author__recipes__in=latest,
+        ).values_list(
+            'user_id', 'author_id', 'author__recipes__id',
+            'author__recipes__pub_date',
+        ).order_by().iterator()
+        self.bulk_create(
+            (self.model(user_id=user_id, author_id=author_id,
+                        recipe_id=recipe_id, pub_date=pub_date)
+             for user_id, author_id, recipe_id, pub_date in rows),
+            batch_size=batch_size)
+
+    def sources(self, user):
+        """Источники ленты: выборки пар (pub_date, id рецепта).
+
+        Возвращает список пар (queryset, имя поля id рецепта): записи
+        ленты пользователя и, если он подписан на авторов без
+        рассылки, их рецепты.
+        """
+        sources = [(self.filter(user=user).values_list(
+            'pub_date', 'recipe_id'), 'recipe_id')]
+        pull_authors = self.pull_authors()
+        if pull_authors:
+            authors = list(Subscribe.objects.filter(
+                user=user, author__in=pull_authors,
+            ).values_list('author_id', flat=True))
+            if authors:
+                sources.append((Recipe.objects.filter(
+                    author__in=authors,
+                ).values_list('pub_date', 'id'), 'id'))
+        return sources
+
+
+class FeedEntry(models.Model):
+    """Модель записи ленты подписок пользователя"""
+    user = models.ForeignKey(User,
+                             on_delete=models.CASCADE,
+                             verbose_name='Пользователь',
+                             related_name='feed')
+    recipe = models.ForeignKey(Recipe,
+                               on_delete=models.CASCADE,
+                               verbose_name='Рецепт',
+                               related_name='feed_entries')
+    author = models.ForeignKey(User,
+                               on_delete=models.CASCADE,
+                               verbose_name='Автор рецепта',
+                               related_name='+')
+    pub_date = models.DateTimeField('Дата публикации')
+
+    objects = FeedEntryManager()
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-recipe'],
+                         name='feed_user_pub_date_idx'),
+            models.Index(fields=['user', 'author'],
+                         name='feed_user_author_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.recipe}'
+
+
+class TrendingRecipeManager(models.Manager):
+    """Расчёт рейтинга популярных рецептов."""
+
+    @staticmethod
+    def decayed_activity(model, since, now, half_life, bucket):
+        """Сумма отметок model с экспоненциальным затуханием по времени.
+
+        Время делится на интервалы длиной bucket, каждый получает вес
+        0.5 ** (возраст / half_life), так что расчёт целиком остаётся
+        на стороне базы.
+        """
+        weights = []
+        end = now
+        while end > since:
+            start = max(end - bucket, since)
+            age = now - (start + (end - start) / 2)
+            weights.append(models.When(
+                created__gte=start, created__lt=end,
+                then=models.Value(0.5 ** (age / half_life))))
+            end = start
+        return models.Subquery(model.objects.filter(
+            recipe=models.OuterRef('pk'),
+            created__gte=since,
+        ).order_by().values('recipe').annotate(
+            total=models.Sum(models.Case(
+                *weights, default=models.Value(0.0),
+                output_field=models.FloatField())),
+        ).values('total'), output_field=models.FloatField())
+
+    def rebuild(self, now, window, half_life, bucket, weights):
+        """Пересчёт таблицы рейтинга одним INSERT ... SELECT.
+
+        weights — веса отметок по моделям, например
+        {Favorite: 1, ShoppingCart: 2}. Возвращает число рецептов
+        в рейтинге.
+        """
+        since = now - window
+        score = sum((
+            Coalesce(self.decayed_activity(
+                model, since, now, half_life, bucket), 0.0) * float(weight)
+            for model, weight in weights.items()), models.Value(0.0))
+        active = models.Q()
+        for model in weights:
+            active |= models.Q(pk__in=model.objects.filter(
+                created__gte=since).values('recipe'))
+        sql, params = Recipe.objects.filter(active).annotate(
+            score=models.ExpressionWrapper(
+                score, output_field=models.FloatField()),
+        ).order_by().values_list('pk', 'score').query.sql_with_params()
+        quote = connection.ops.quote_name
+        with transaction.atomic(), connection.cursor() as cursor:
+            self.all().delete()
+            cursor.execute(
+                f'INSERT INTO {quote(self.model._meta.db_table)} '
+                f'({quote("recipe_id")}, {quote("score")}) {sql}', params)
+            return cursor.rowcount
+
+
+class TrendingRecipe(models.Model):
+    """Модель рейтинга популярных рецептов"""
+    recipe = models.OneToOneField(Recipe,
+                                  on_delete=models.CASCADE,
+                                  primary_key=True,
+                                  verbose_name='Рецепт',
+                                  related_name='trending')
+    score = models.FloatField('Рейтинг')
+
+    objects = TrendingRecipeManager()
+
+    class Meta:
+        verbose_name = 'Популярный рецепт'
+        verbose_name_plural = 'Популярные рецепты'
+        indexes = [
+            models.Index(fields=['-score'], name='trending_score_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe}: {self.score:.2f}'
@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Массовое изменение строк модели в обход save()/delete(),
+# например bulk_create или bulk_update. Отправитель — класс модели.
+bulk_changed = Signal()
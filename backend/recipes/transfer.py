@@ -0,0 +1,357 @@
+"""Потоковая выгрузка и загрузка рецептов в формате NDJSON.
+
+Одна строка — один рецепт с автором, тегами и ингредиентами. Автор
+указывается по username, теги — по slug, ингредиенты — по названию и
+единице измерения, так что файл переносится между базами с разными id.
+Фото не встраиваются: в строке лежит путь в хранилище и, по желанию,
+sha256 содержимого.
+"""
+import hashlib
+import json
+import os
+import re
+import time
+from collections import defaultdict
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from recipes.models import (FeedEntry, Ingredient, IngredientInRecipe, Recipe,
+                            Tag)
+from recipes.signals import bulk_changed
+from users.models import User
+
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+HASHED_IMAGES_DIR = 'recipes'
+SHA256_RE = re.compile(r'[0-9a-f]{64}')
+
+
+class TransferError(ValueError):
+    """Ошибка в строке файла рецептов."""
+
+    def __init__(self, line, message):
+        self.line = line
+        super().__init__(f'Строка {line}: {message}')
+
+
+def bulk_create_recipes(recipes, batch_size=None):
+    """bulk_create рецептов с сохранением заданных дат публикации.
+
+    auto_now_add перезаписывает pub_date при вставке, поэтому даты
+    возвращаются отдельным bulk_update. id проставляются и в базах,
+    где bulk_create их не возвращает.
+    """
+    recipes = list(recipes)
+    dates = [recipe.pub_date for recipe in recipes]
+    last_id = Recipe.objects.order_by('-id').values_list(
+        'id', flat=True).first() or 0
+    Recipe.objects.bulk_create(recipes, batch_size=batch_size)
+    if recipes and recipes[0].pk is None:
+        for recipe, pk in zip(recipes, Recipe.objects.filter(
+                id__gt=last_id).order_by('id').values_list('id', flat=True)):
+            recipe.pk = pk
+    for recipe, pub_date in zip(recipes, dates):
+        recipe.pub_date = pub_date
+    # Каждая строка UPDATE ... CASE перебирает все условия пакета,
+    # поэтому пакеты здесь небольшие.
+    Recipe.objects.bulk_update(recipes, ['pub_date'], batch_size=500)
+    return recipes
+
+
+def file_sha256(file):
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def recipe_record(recipe, with_hashes=False):
+    """Рецепт с загруженными with_related() связями в виде словаря."""
+    image = {'path': recipe.image.name}
+    if with_hashes:
+        try:
+            with default_storage.open(recipe.image.name, 'rb') as file:
+                image['sha256'] = file_sha256(file)
+        except OSError:
+            pass
+    return {
+        'id': recipe.id,
+        'author': recipe.author.username,
+        'name': recipe.name,
+        'text': recipe.text,
+        'cooking_time': recipe.cooking_time,
+        'pub_date': recipe.pub_date.isoformat(),
+        'image': image,
+        'tags': [{'name': tag.name, 'color': tag.color, 'slug': tag.slug}
+                 for tag in recipe.tags.all()],
+        'ingredients': [
+            {'name': item.ingredients.name,
+             'measurement_unit': item.ingredients.measurement_unit,
+             'amount': item.amount}
+            for item in recipe.recipe_ingredients.all()
+            if item.ingredients is not None],
+    }
+
+
+def export_recipes(queryset=None, with_hashes=False, batch_size=500):
+    """Строки NDJSON с рецептами по возрастанию id.
+
+    Рецепты читаются пакетами по id, поэтому память не зависит от
+    размера выгрузки.
+    """
+    if queryset is None:
+        queryset = Recipe.objects.all()
+    queryset = queryset.with_related().order_by('id')
+    last_id = 0
+    while True:
+        batch = list(queryset.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            return
+        for recipe in batch:
+            yield json.dumps(recipe_record(recipe, with_hashes),
+                             ensure_ascii=False) + '\n'
+        last_id = batch[-1].id
+
+
+class RecipeImporter:
+    """Загрузка рецептов из строк NDJSON пакетами в транзакциях.
+
+    Каждый пакет фиксируется отдельно, а после него запоминается номер
+    последней строки. Рецепт с тем же автором, названием и датой
+    публикации считается уже загруженным и пропускается, поэтому
+    после сбоя файл можно загрузить повторно целиком или с --skip.
+    Недостающие теги и ингредиенты создаются.
+
+    images_dir — каталог с фото исходного хранилища. Если он указан,
+    недостающие файлы копируются в хранилище: с sha256 — под именем
+    по хэшу, без него — по исходному пути.
+    """
+
+    def __init__(self, images_dir=None, batch_size=500,
+                 storage=default_storage):
+        self.images_dir = images_dir
+        self.batch_size = batch_size
+        self.storage = storage
+        self.line = 0
+        self.created = 0
+        self.skipped = 0
+        self.changed = set()
+        self.started = None
+        self.finished = None
+        self.first_line = 0
+
+    @property
+    def elapsed(self):
+        """Время загрузки в секундах."""
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def rate(self):
+        """Скорость загрузки без пропущенных по skip строк, строк в секунду."""
+        loaded = self.line - self.first_line
+        elapsed = self.elapsed
+        return loaded / elapsed if elapsed else loaded
+
+    def stats(self):
+        return {'line': self.line, 'created': self.created,
+                'skipped': self.skipped, 'elapsed': round(self.elapsed, 3),
+                'rate': round(self.rate, 1)}
+
+    def run(self, lines, skip=0, progress=None):
+        """Загрузка строк; progress вызывается после каждого пакета."""
+        self.started = time.monotonic()
+        self.finished = None
+        numbered = enumerate(lines, 1)
+        self.line += sum(1 for _ in islice(numbered, skip))
+        self.first_line = self.line
+        try:
+            while True:
+                chunk = list(islice(numbered, self.batch_size))
+                if not chunk:
+                    break
+                records = [(number, self.parse(number, line))
+                           for number, line in chunk if line.strip()]
+                with transaction.atomic():
+                    self.load(records)
+                self.line = chunk[-1][0]
+                if progress is not None:
+                    progress(self)
+        finally:
+            self.finished = time.monotonic()
+            for model in self.changed:
+                bulk_changed.send(sender=model)
+        return self.stats()
+
+    @staticmethod
+    def parse(number, line):
+        try:
+            record = json.loads(line)
+        except ValueError as err:
+            raise TransferError(number, f'неверный JSON: {err}')
+        if not isinstance(record, dict):
+            raise TransferError(number, 'ожидался объект')
+        for key in ('author', 'name', 'text', 'cooking_time', 'pub_date',
+                    'image', 'ingredients'):
+            if key not in record:
+                raise TransferError(number, f'нет поля {key}')
+        record['pub_date'] = parse_datetime(str(record['pub_date']))
+        if record['pub_date'] is None:
+            raise TransferError(number, 'неверная дата публикации')
+        if isinstance(record['image'], str):
+            record['image'] = {'path': record['image']}
+        if not record['ingredients']:
+            raise TransferError(number, 'нет ингредиентов')
+        try:
+            record['ingredients'] = [
+                (item['name'], item['measurement_unit'], int(item['amount']))
+                for item in record['ingredients']]
+            record['tags'] = [
+                {key: tag[key] for key in ('name', 'color', 'slug')}
+                for tag in record.get('tags', ())]
+        except (KeyError, TypeError, ValueError) as err:
+            raise TransferError(
+                number, f'неверные ингредиенты или теги: {err!r}')
+        return record
+
+    def load(self, records):
+        authors = self.resolve_authors(records)
+        tags = self.resolve_tags(records)
+        ingredients = self.resolve_ingredients(records)
+        existing = set(Recipe.objects.filter(
+            author_id__in=set(authors.values()),
+            pub_date__in={record['pub_date'] for _, record in records},
+        ).values_list('author_id', 'name', 'pub_date'))
+        recipes = []
+        for number, record in records:
+            recipe = Recipe(
+                author_id=authors[record['author']],
+                name=record['name'],
+                text=record['text'],
+                cooking_time=record['cooking_time'],
+                pub_date=record['pub_date'],
+            )
+            key = (recipe.author_id, recipe.name, recipe.pub_date)
+            if key in existing:
+                self.skipped += 1
+                continue
+            existing.add(key)
+            try:
+                recipe.full_clean(exclude=('author', 'image'))
+            except ValidationError as err:
+                raise TransferError(number, err.messages)
+            recipe.image = self.resolve_image(number, record['image'])
+            recipes.append((number, record, recipe))
+        if not recipes:
+            return
+        bulk_create_recipes(recipe for *_, recipe in recipes)
+        rows = []
+        links = []
+        for number, record, recipe in recipes:
+            amounts = defaultdict(int)
+            for name, unit, amount in record['ingredients']:
+                amounts[ingredients[name, unit]] += amount
+            for pk, amount in amounts.items():
+                row = IngredientInRecipe(recipe=recipe, ingredients_id=pk,
+                                         amount=amount)
+                try:
+                    row.clean_fields(exclude=('recipe', 'ingredients'))
+                except ValidationError as err:
+                    raise TransferError(number, err.messages)
+                rows.append(row)
+            links.extend(
+                Recipe.tags.through(recipe=recipe, tag_id=pk)
+                for pk in {tags[tag['slug']] for tag in record['tags']})
+        IngredientInRecipe.objects.bulk_create(rows)
+        Recipe.tags.through.objects.bulk_create(links)
+        Recipe.objects.filter(
+            pk__in=[recipe.pk for *_, recipe in recipes],
+        ).update_search_vector()
+        FeedEntry.objects.fan_out_many(recipe for *_, recipe in recipes)
+        self.created += len(recipes)
+        self.changed.update((Recipe, IngredientInRecipe))
+
+    @staticmethod
+    def resolve_authors(records):
+        usernames = {record['author'] for _, record in records}
+        authors = dict(User.objects.filter(
+            username__in=usernames).values_list('username', 'id'))
+        for number, record in records:
+            if record['author'] not in authors:
+                raise TransferError(
+                    number, f'нет пользователя {record["author"]}')
+        return authors
+
+    def resolve_tags(self, records):
+        """id тегов по slug, недостающие создаются."""
+        found = {}
+        for _, record in records:
+            for tag in record['tags']:
+                found.setdefault(tag['slug'], tag)
+        tags = dict(Tag.objects.filter(
+            slug__in=found).values_list('slug', 'id'))
+        missing = [Tag(name=tag['name'], color=tag['color'], slug=slug)
+                   for slug, tag in found.items() if slug not in tags]
+        if missing:
+            Tag.objects.bulk_create(missing, ignore_conflicts=True)
+            tags = dict(Tag.objects.filter(
+                slug__in=found).values_list('slug', 'id'))
+            self.changed.add(Tag)
+        for number, record in records:
+            for tag in record['tags']:
+                if tag['slug'] not in tags:
+                    raise TransferError(
+                        number, f'не удалось создать тег {tag["slug"]}')
+        return tags
+
+    def resolve_ingredients(self, records):
+        """id ингредиентов по названию и единице, недостающие создаются."""
+        keys = {(name, unit) for _, record in records
+                for name, unit, _ in record['ingredients']}
+        names = {name for name, _ in keys}
+
+        def fetch():
+            rows = Ingredient.objects.filter(name__in=names).values_list(
+                'id', 'name', 'measurement_unit')
+            return {(name, unit): pk for pk, name, unit in rows
+                    if (name, unit) in keys}
+
+        ingredients = fetch()
+        missing = keys - set(ingredients)
+        if missing:
+            Ingredient.objects.bulk_create(
+                (Ingredient(name=name, measurement_unit=unit)
+                 for name, unit in missing),
+                ignore_conflicts=True)
+            ingredients = fetch()
+            self.changed.add(Ingredient)
+        return ingredients
+
+    def resolve_image(self, number, image):
+        """Имя файла фото в хранилище."""
+        path = os.path.normpath(str(image.get('path') or ''))
+        if not image.get('path') or os.path.isabs(path) or (
+                path.split(os.sep)[0] == '..'):
+            raise TransferError(number, 'неверный путь фото')
+        sha256 = image.get('sha256')
+        name = path
+        if sha256:
+            if not SHA256_RE.fullmatch(str(sha256)):
+                raise TransferError(number, 'неверный sha256 фото')
+            name = f'{HASHED_IMAGES_DIR}/{sha256}{os.path.splitext(path)[1]}'
+        if self.images_dir is None or self.storage.exists(name):
+            return name
+        try:
+            with open(os.path.join(self.images_dir, path), 'rb') as file:
+                file = File(file)
+                if sha256 and file_sha256(file) != sha256:
+                    raise TransferError(number, 'sha256 фото не совпадает')
+                file.seek(0)
+                return self.storage.save(name, file)
+        except OSError as err:
+            raise TransferError(number, f'нет файла фото: {err}')
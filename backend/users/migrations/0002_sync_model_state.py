@@ -0,0 +1,60 @@
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def drop_invalid_subscriptions(apps, schema_editor):
+    """Подписки, которые нарушили бы новые ограничения.
+
+    Прежний get_or_create при гонке запросов создавал повторные
+    подписки, а подписку на себя ничто не запрещало. Остаётся самая
+    ранняя подписка каждой пары, подписки на себя удаляются.
+    """
+    Subscribe = apps.get_model('users', 'Subscribe')
+    Subscribe.objects.filter(user=models.F('author')).delete()
+    Subscribe.objects.exclude(id__in=Subscribe.objects.values(
+        'user', 'author',
+    ).annotate(keep=models.Min('id')).order_by().values('keep')).delete()
+
+
+class Migration(migrations.Migration):
+    """Приведение миграций в соответствие с моделями.
+
+    Модель Follow была переименована в Subscribe без миграции.
+    Переименование сохраняет данные. Перед ограничениями удаляются
+    повторные подписки и подписки на себя.
+    """
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RenameModel('Follow', 'Subscribe'),
+        migrations.AlterField(
+            model_name='subscribe',
+            name='author',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subscribing', to=settings.AUTH_USER_MODEL, verbose_name='Автор'),
+        ),
+        migrations.AlterField(
+            model_name='subscribe',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subscriber', to=settings.AUTH_USER_MODEL, verbose_name='Подписчик'),
+        ),
+        migrations.RunPython(drop_invalid_subscriptions,
+                             migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='subscribe',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='unique_subscriber'),
+        ),
+        migrations.AddConstraint(
+            model_name='subscribe',
+            constraint=models.CheckConstraint(check=models.Q(('user', models.F('author')), _negated=True), name='Нельзя подписаться на себя'),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='username',
+            field=models.CharField(max_length=150, unique=True, validators=[django.core.validators.RegexValidator(message='Введено некорректное значение поля username', regex='^[\\w.@+-]+\\Z')], verbose_name='Никнейм'),
+        ),
+    ]